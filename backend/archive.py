@@ -0,0 +1,127 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bson import ObjectId
+from pymongo import DeleteOne, ReplaceOne
+from pymongo.errors import PyMongoError
+
+# Feedback older than this many days moves to ``feedback_archive``; 0 disables archiving.
+# Ranges that start inside the horizon never consult the archive, so raising
+# it after documents were archived hides those documents from such ranges.
+FEEDBACK_ARCHIVE_AFTER_DAYS = int(os.getenv("FEEDBACK_ARCHIVE_AFTER_DAYS", "180"))
+FEEDBACK_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("FEEDBACK_ARCHIVE_INTERVAL_SECONDS", "3600"))
+FEEDBACK_ARCHIVE_BATCH_SIZE = int(os.getenv("FEEDBACK_ARCHIVE_BATCH_SIZE", "500"))
+
+
+def archive_enabled() -> bool:
+    return FEEDBACK_ARCHIVE_AFTER_DAYS > 0
+
+
+def archive_cutoff() -> Optional[datetime]:
+    if not archive_enabled():
+        return None
+    return datetime.utcnow() - timedelta(days=FEEDBACK_ARCHIVE_AFTER_DAYS)
+
+
+def range_needs_archive(since: Optional[datetime]) -> bool:
+    """Whether a query for feedback created at or after ``since`` can hit archived data."""
+    if not archive_enabled():
+        return False
+    return since is None or since < archive_cutoff()
+
+
+async def create_archive_indexes(db):
+    from database import create_feedback_indexes
+    await create_feedback_indexes(db.feedback_archive)
+
+
+async def archive_old_feedback(db, cutoff: Optional[datetime] = None, batch_size: int = FEEDBACK_ARCHIVE_BATCH_SIZE) -> int:
+    """Move feedback created before ``cutoff`` into ``feedback_archive``.
+
+    Documents are copied with upserts and then removed from ``feedback`` only
+    if ``updated_at`` is unchanged. When an edit lands mid-move, the hot
+    document is kept and its archive copy is deleted again, so reads that
+    merge both collections never see it twice. The next run picks it up
+    again. Age comes from the ``_id`` timestamp, which is the creation time
+    in both storage layouts.
+    """
+    cutoff = cutoff or archive_cutoff()
+    if cutoff is None:
+        return 0
+
+    moved = 0
+    last_id = None
+    while True:
+        query = {"_id": {"$lt": ObjectId.from_datetime(cutoff)}}
+        if last_id is not None:
+            query["_id"]["$gt"] = last_id
+        batch = await db.feedback.find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        # Filters carry the full shard key ({org_id, _id}): upserts into a
+        # sharded feedback_archive require it, and it targets a single shard.
+        await db.feedback_archive.bulk_write(
+            [ReplaceOne({"org_id": doc.get("org_id"), "_id": doc["_id"]}, doc, upsert=True) for doc in batch],
+            ordered=False
+        )
+        result = await db.feedback.bulk_write(
+            [
+                DeleteOne({
+                    "org_id": doc.get("org_id"),
+                    "_id": doc["_id"],
+                    "updated_at": doc.get("updated_at"),
+                    "u": doc.get("u")
+                })
+                for doc in batch
+            ],
+            ordered=False
+        )
+        moved += result.deleted_count
+        if result.deleted_count < len(batch):
+            kept = await db.feedback.distinct("_id", {"_id": {"$in": [doc["_id"] for doc in batch]}})
+            if kept:
+                await db.feedback_archive.delete_many({"_id": {"$in": kept}})
+
+    return moved
+
+
+class FeedbackArchiver:
+    """Periodically archives old feedback; one worker at a time holds the lease."""
+
+    def __init__(self, db, interval_seconds: int = FEEDBACK_ARCHIVE_INTERVAL_SECONDS):
+        self.db = db
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if archive_enabled() and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        from database import acquire_lease
+
+        while True:
+            try:
+                if await acquire_lease("feedback_archive", self.interval_seconds):
+                    moved = await archive_old_feedback(self.db)
+                    if moved:
+                        print(f"Archived {moved} feedback documents")
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                print(f"Feedback archiving failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
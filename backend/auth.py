@@ -3,12 +3,14 @@ from typing import Optional
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from models import UserDB
+from models import UserDB, DEFAULT_ORG_ID, get_request_scope
 import os
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 50
+# Comma-separated emails allowed to use the /api/admin endpoints.
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
 
 security = HTTPBearer()
 
@@ -22,33 +24,52 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str):
+def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return user_id
     except jwt.PyJWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if payload.get("sub") is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return payload
+
+def verify_token(token: str):
+    return decode_token(token)["sub"]
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
-    user_id = verify_token(credentials.credentials)
+    payload = decode_token(credentials.credentials)
+    user_id = payload["sub"]
+    org_id = payload.get("org", DEFAULT_ORG_ID)
+
+    # From here on every query in this request is scoped to the caller's organization.
+    scope = get_request_scope()
+    if scope is not None:
+        scope.org_id = org_id
+        scope.user_id = user_id
+
     user = await UserDB.get_user_by_id(user_id)
-    if user is None:
+    if user is None or user.org_id != org_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
     return user
+
+async def get_admin_user(current_user = Depends(get_current_user)):
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
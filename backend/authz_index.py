@@ -0,0 +1,188 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import PyMongoError
+
+from invalidation import InvalidationBus, InvalidationEvent, InvalidationType, bus
+
+AUTHZ_INDEX_ENABLED = os.getenv("AUTHZ_INDEX_ENABLED", "1") == "1"
+# Most feedback ownership entries held; the newest feedback is seeded and the
+# oldest entries are evicted first. Misses fall back to a database read.
+AUTHZ_INDEX_FEEDBACK_LIMIT = int(os.getenv("AUTHZ_INDEX_FEEDBACK_LIMIT", "500000"))
+# User entries older than this are treated as misses and refreshed by the
+# database read that follows, bounding how long a missed change stream event
+# (e.g. one made while the index was seeding) can keep a stale manager.
+AUTHZ_INDEX_MAX_AGE_SECONDS = float(os.getenv("AUTHZ_INDEX_MAX_AGE_SECONDS", "300"))
+
+NO_MANAGER = b""
+OWNER_FIELDS = {"manager_id", "employee_id", "m", "e"}
+
+
+def _key(object_id) -> Optional[bytes]:
+    if isinstance(object_id, ObjectId):
+        return object_id.binary
+    try:
+        return ObjectId(object_id).binary
+    except (InvalidId, TypeError):
+        return None
+
+
+def _owners(document: dict) -> Tuple[Optional[ObjectId], Optional[ObjectId]]:
+    """Giver and receiver of a stored feedback document in either layout."""
+    return document.get("manager_id", document.get("m")), document.get("employee_id", document.get("e"))
+
+
+class AuthzIndex:
+    """In-memory copy of the facts permission checks need.
+
+    ``users`` maps a user to its organization and manager, ``feedback`` maps
+    feedback to its giver and receiver; ids are kept as 12-byte ObjectId
+    binaries. Entries are written by this process's own writes and reads and
+    by change stream events from other workers, so a change made elsewhere
+    is seen after the change stream lag and, for users, at most
+    ``max_age_seconds`` later. The index only ever answers "known" or
+    "miss": callers use a hit to allow a request without a read and go
+    through the database for misses and for anything they would deny.
+    """
+
+    def __init__(
+        self,
+        db,
+        event_bus: InvalidationBus = bus,
+        feedback_limit: int = AUTHZ_INDEX_FEEDBACK_LIMIT,
+        max_age_seconds: float = AUTHZ_INDEX_MAX_AGE_SECONDS
+    ):
+        self.db = db
+        self.bus = event_bus
+        self.feedback_limit = feedback_limit
+        self.max_age_seconds = max_age_seconds
+        # user -> (org_id, manager binary, monotonic time the entry was learned)
+        self.users: Dict[bytes, Tuple[str, bytes, float]] = {}
+        self.feedback: Dict[bytes, bytes] = {}
+        self.hits = 0
+        self.misses = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if AUTHZ_INDEX_ENABLED and self._task is None:
+            self.bus.subscribe(self._on_user_event, "users")
+            self.bus.subscribe(self._on_feedback_event, "feedback")
+            self._task = asyncio.create_task(self.seed())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self.bus.unsubscribe(self._on_user_event, "users")
+        self.bus.unsubscribe(self._on_feedback_event, "feedback")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def seed(self):
+        """Load every user and the newest feedback, keeping entries written meanwhile."""
+        try:
+            async for user in self.db.users.find({}, {"org_id": 1, "manager_id": 1}):
+                self.users.setdefault(user["_id"].binary, self._user_entry(user.get("org_id"), user.get("manager_id")))
+            cursor = self.db.feedback.find({}, {field: 1 for field in OWNER_FIELDS}).sort("_id", -1).limit(self.feedback_limit)
+            async for document in cursor:
+                if len(self.feedback) >= self.feedback_limit:
+                    break
+                giver, receiver = _owners(document)
+                if giver is not None and receiver is not None:
+                    self.feedback.setdefault(document["_id"].binary, giver.binary + receiver.binary)
+            print(f"Authorization index seeded with {len(self.users)} users and {len(self.feedback)} feedback")
+        except PyMongoError as e:
+            print(f"Authorization index seeding failed: {e}")
+
+    @staticmethod
+    def _user_entry(org_id, manager_id) -> Tuple[str, bytes, float]:
+        from models import DEFAULT_ORG_ID
+        return org_id or DEFAULT_ORG_ID, _key(manager_id) if manager_id else NO_MANAGER, time.monotonic()
+
+    def remember_user(self, user_id, org_id: Optional[str], manager_id):
+        key = _key(user_id)
+        if key is not None:
+            self.users[key] = self._user_entry(org_id, manager_id)
+
+    def forget_user(self, user_id):
+        self.users.pop(_key(user_id), None)
+
+    def user_manager(self, user_id: str, org_id: str) -> Tuple[bool, Optional[str]]:
+        """``(known, manager id)`` for a user of ``org_id``; unknown on a miss."""
+        entry = self.users.get(_key(user_id))
+        if entry is None or entry[0] != org_id or time.monotonic() - entry[2] > self.max_age_seconds:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, str(ObjectId(entry[1])) if entry[1] else None
+
+    def remember_feedback(self, feedback_id, manager_id, employee_id):
+        key, giver, receiver = _key(feedback_id), _key(manager_id), _key(employee_id)
+        if key is None or giver is None or receiver is None:
+            return
+        self.feedback.pop(key, None)
+        if len(self.feedback) >= self.feedback_limit:
+            self.feedback.pop(next(iter(self.feedback)))
+        self.feedback[key] = giver + receiver
+
+    def forget_feedback(self, feedback_id):
+        self.feedback.pop(_key(feedback_id), None)
+
+    def feedback_owners(self, feedback_id: str) -> Optional[Tuple[str, str]]:
+        """``(giver id, receiver id)`` of feedback, or None on a miss."""
+        entry = self.feedback.get(_key(feedback_id))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return str(ObjectId(entry[:12])), str(ObjectId(entry[12:]))
+
+    def clear(self):
+        self.users.clear()
+        self.feedback.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self.users),
+            "feedback": len(self.feedback),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _on_user_event(self, event: InvalidationEvent):
+        if event.type in (InvalidationType.insert, InvalidationType.replace) and event.document:
+            self.remember_user(event.document_id, event.document.get("org_id"), event.document.get("manager_id"))
+        elif event.type == InvalidationType.update:
+            changed = set(event.updated_fields) | set(event.removed_fields)
+            if changed & {"org_id", "manager_id"}:
+                self.forget_user(event.document_id)
+        elif event.type == InvalidationType.delete:
+            self.forget_user(event.document_id)
+
+    def _on_feedback_event(self, event: InvalidationEvent):
+        if event.type == InvalidationType.flush:
+            # Changes may have been missed; start over from the database.
+            self.clear()
+            if self._task is not None and self._task.done():
+                self._task = asyncio.create_task(self.seed())
+        elif event.type in (InvalidationType.insert, InvalidationType.replace) and event.document:
+            self.remember_feedback(event.document_id, *_owners(event.document))
+        elif event.type == InvalidationType.update:
+            changed = set(event.updated_fields) | set(event.removed_fields)
+            if changed & OWNER_FIELDS:
+                self.forget_feedback(event.document_id)
+        elif event.type == InvalidationType.delete:
+            self.forget_feedback(event.document_id)
@@ -0,0 +1,98 @@
+"""Compare bytes on the wire and CPU cost of response compression settings.
+
+    python bench_compression.py [--items 50 200 1000] [--repeat 20]
+
+Payloads are synthetic feedback lists shaped like the /api/feedback response.
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from compression import brotli
+
+WORDS = (
+    "communication ownership delivery deadline stakeholder clarity mentoring review "
+    "documentation testing initiative collaboration planning estimation quality "
+    "feedback proactive reliable presentation design improvement consistent detail"
+).split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def build_payload(items: int, seed: int = 7) -> bytes:
+    rng = random.Random(seed)
+    managers = [str(ObjectId()) for _ in range(5)]
+    employees = [str(ObjectId()) for _ in range(40)]
+    now = datetime.utcnow()
+    feedback = []
+    for _ in range(items):
+        manager_id, employee_id = rng.choice(managers), rng.choice(employees)
+        created_at = (now - timedelta(minutes=rng.randint(0, 500000))).isoformat()
+        feedback.append({
+            "id": str(ObjectId()),
+            "giver_id": manager_id,
+            "receiver_id": employee_id,
+            "strengths": " ".join(sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(2, 6))),
+            "improvements": " ".join(sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(1, 5))),
+            "sentiment": rng.choice(["positive", "neutral", "constructive"]),
+            "tags": rng.sample(WORDS, rng.randint(0, 4)),
+            "anonymous": rng.random() < 0.1,
+            "acknowledged": rng.random() < 0.6,
+            "acknowledged_at": None,
+            "acknowledgment_comment": None,
+            "created_at": created_at,
+            "updated_at": created_at,
+            "giver_name": "Manager Name",
+            "receiver_name": "Employee Name",
+            "giver_role": "manager",
+            "manager_id": None,
+            "employee_id": None,
+            "manager_name": None,
+            "employee_name": None,
+        })
+    return json.dumps(feedback).encode()
+
+
+def codecs():
+    yield "identity", lambda body: body
+    for level in (1, 6, 9):
+        yield f"gzip-{level}", lambda body, level=level: gzip.compress(body, compresslevel=level, mtime=0)
+    if brotli is not None:
+        for quality in (1, 5, 11):
+            yield f"br-{quality}", lambda body, quality=quality: brotli.compress(body, quality=quality)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if brotli is None:
+        print("brotli is not installed; only gzip is measured\n")
+
+    print(f"{'items':>6} {'codec':<10} {'bytes':>10} {'ratio':>7} {'cpu ms/op':>10} {'MB/s':>8}")
+    for items in args.items:
+        body = build_payload(items)
+        for name, compress in codecs():
+            start = time.process_time()
+            for _ in range(args.repeat):
+                encoded = compress(body)
+            elapsed = (time.process_time() - start) / args.repeat
+            throughput = len(body) / elapsed / 1e6 if elapsed else float("inf")
+            print(
+                f"{items:>6} {name:<10} {len(encoded):>10} {len(body) / len(encoded):>7.1f} "
+                f"{elapsed * 1000:>10.3f} {throughput:>8.0f}"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
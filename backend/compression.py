@@ -0,0 +1,210 @@
+import asyncio
+import gzip
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+# Bodies at least this large are compressed in a worker thread instead of on
+# the event loop.
+COMPRESSION_THREAD_THRESHOLD = int(os.getenv("COMPRESSION_THREAD_THRESHOLD", "65536"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+# Cache-Control per GET path. Everything here is per-user data behind a bearer
+# token, so nothing may be cached by shared proxies; "no-cache" still lets the
+# browser keep a copy and revalidate it with If-None-Match.
+CACHE_POLICIES: Dict[str, str] = {
+    "/api/feedback": "private, no-cache",
+    "/api/feedback/received": "private, no-cache",
+    "/api/feedback/given": "private, no-cache",
+    "/api/feedback-requests": "private, no-cache",
+    "/api/dashboard": "private, no-cache",
+    "/api/stats": "private, no-cache",
+    "/api/team": "private, no-cache",
+    "/api/auth/me": "private, no-cache",
+    "/api/managers": "private, max-age=60",
+}
+DEFAULT_GET_CACHE_POLICY = "private, no-cache"
+DEFAULT_CACHE_POLICY = "no-store"
+VARY_HEADERS = "Authorization, Accept-Encoding"
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header, or None."""
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            offered[name.strip().lower()] = quality
+
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_quality = None, 0.0
+    for encoding in candidates:
+        quality = offered.get(encoding, offered.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _get_header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _set_header(headers: List[Tuple[bytes, bytes]], name: bytes, value: bytes):
+    headers[:] = [(key, existing) for key, existing in headers if key.lower() != name]
+    headers.append((name, value))
+
+
+class _BufferedResponse:
+    """Collects a single-body ASGI response so it can be rewritten before sending."""
+
+    def __init__(self, send):
+        self.send = send
+        self.start = None
+        self.body = b""
+        self.streaming = False
+
+    async def __call__(self, message):
+        if self.streaming:
+            await self.send(message)
+        elif message["type"] == "http.response.start":
+            self.start = message
+        elif message["type"] == "http.response.body":
+            if message.get("more_body", False):
+                # Streaming responses pass through untouched.
+                self.streaming = True
+                await self.send(self.start)
+                await self.send({**message, "body": self.body + message.get("body", b"")})
+                return
+            self.body += message.get("body", b"")
+        else:
+            await self.send(message)
+
+    @property
+    def complete(self) -> bool:
+        return self.start is not None and not self.streaming
+
+
+class CachePolicyMiddleware:
+    """Adds Cache-Control/Vary per route and answers revalidations with 304."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response = _BufferedResponse(send)
+        await self.app(scope, receive, response)
+        if not response.complete:
+            return
+
+        start, body = response.start, response.body
+        headers = list(start.get("headers", []))
+        method = scope["method"]
+
+        if method in ("GET", "HEAD"):
+            policy = CACHE_POLICIES.get(scope["path"].rstrip("/") or "/", DEFAULT_GET_CACHE_POLICY)
+        else:
+            policy = DEFAULT_CACHE_POLICY
+        if _get_header(headers, b"cache-control") is None:
+            _set_header(headers, b"cache-control", policy.encode())
+        vary = _get_header(headers, b"vary")
+        _set_header(headers, b"vary", (vary + b", " if vary else b"") + VARY_HEADERS.encode())
+
+        if method in ("GET", "HEAD") and start["status"] == 200 and policy != DEFAULT_CACHE_POLICY:
+            etag = _get_header(headers, b"etag")
+            if etag is None:
+                etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'.encode()
+                _set_header(headers, b"etag", etag)
+            request_headers = scope.get("headers", [])
+            if_none_match = _get_header(request_headers, b"if-none-match")
+            if if_none_match is not None and etag in [tag.strip() for tag in if_none_match.split(b",")]:
+                headers = [(key, value) for key, value in headers if key.lower() not in (b"content-length", b"content-type")]
+                await send({"type": "http.response.start", "status": 304, "headers": headers})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        await send({**start, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+class CompressionMiddleware:
+    """Negotiated brotli/gzip compression for responses above a size threshold."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = _get_header(scope.get("headers", []), b"accept-encoding")
+        encoding = negotiate_encoding(accept_encoding.decode("latin-1")) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        response = _BufferedResponse(send)
+        await self.app(scope, receive, response)
+        if not response.complete:
+            return
+
+        start, body = response.start, response.body
+        headers = list(start.get("headers", []))
+        content_type = (_get_header(headers, b"content-type") or b"").decode("latin-1")
+
+        if (
+            len(body) < self.minimum_size
+            or _get_header(headers, b"content-encoding") is not None
+            or not content_type.startswith(COMPRESSIBLE_TYPES)
+        ):
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        if len(body) >= COMPRESSION_THREAD_THRESHOLD:
+            compressed = await asyncio.to_thread(compress_body, body, encoding)
+        else:
+            compressed = compress_body(body, encoding)
+
+        _set_header(headers, b"content-encoding", encoding.encode())
+        _set_header(headers, b"content-length", str(len(compressed)).encode())
+        etag = _get_header(headers, b"etag")
+        if etag is not None and not etag.startswith(b"W/"):
+            # The encoded bytes differ from the identity ones, so a strong
+            # validator no longer applies.
+            _set_header(headers, b"etag", b"W/" + etag)
+        await send({**start, "headers": headers})
+        await send({"type": "http.response.body", "body": compressed})
@@ -1,14 +1,30 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta
 import os
+import socket
 from dotenv import load_dotenv
 from typing import Optional
 
 load_dotenv()
 
+from invalidation import ChangeStreamWatcher
+from idempotency import create_idempotency_indexes
+from archive import FeedbackArchiver, create_archive_indexes
+from digest import FeedbackDigestScheduler, create_feedback_request_indexes
+from jobs import JobRunner, create_job_indexes
+from sentiment import SentimentPipeline
+from authz_index import AuthzIndex
+from read_routing import READ_PREFERENCES, ReadRoute, read_metrics
+from profiling import profile_store
+
 MONGODB_URL = os.getenv("MONGODB_URL")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 
+# Identifies this process when it holds a lease on shared background work.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
 
 client: Optional[AsyncIOMotorClient] = None
 database = None
@@ -17,28 +33,121 @@ database = None
 sync_client: Optional[MongoClient] = None
 sync_database = None
 
-async def connect_to_mongo():
+change_stream_watcher: Optional[ChangeStreamWatcher] = None
+sentiment_pipeline: Optional[SentimentPipeline] = None
+authz_index: Optional[AuthzIndex] = None
+# Long-running tasks tied to the connection lifecycle; each has start()/stop().
+background_services = []
+
+async def connect_to_mongo(start_services: bool = True):
     
-    global client, database, sync_client, sync_database
-    client = AsyncIOMotorClient(MONGODB_URL)
+    global client, database, sync_client, sync_database, change_stream_watcher, sentiment_pipeline, authz_index
+    client = AsyncIOMotorClient(MONGODB_URL, event_listeners=[read_metrics])
     database = client[DATABASE_NAME]
     
-    sync_client = MongoClient(MONGODB_URL)
+    sync_client = MongoClient(MONGODB_URL, event_listeners=[read_metrics])
     sync_database = sync_client[DATABASE_NAME]
     
-    await database.users.create_index("email", unique=True)
-    await database.feedback.create_index([("manager_id", 1), ("employee_id", 1)])
-    await database.feedback.create_index("created_at")
+    await create_indexes(database)
+
+    if not start_services:
+        return
+
+    change_stream_watcher = ChangeStreamWatcher(database)
+    sentiment_pipeline = SentimentPipeline(database)
+    authz_index = AuthzIndex(database)
+    background_services.extend([
+        authz_index,
+        change_stream_watcher,
+        sentiment_pipeline,
+        FeedbackArchiver(database),
+        FeedbackDigestScheduler(database),
+        JobRunner(database),
+    ])
+    for service in background_services:
+        service.start()
 
 async def close_mongo_connection():
-    global client, sync_client
+    global client, sync_client, change_stream_watcher, sentiment_pipeline, authz_index
+    for service in reversed(background_services):
+        await service.stop()
+    background_services.clear()
+    change_stream_watcher = None
+    sentiment_pipeline = None
+    authz_index = None
     if client:
         client.close()
     if sync_client:
         sync_client.close()
 
+async def create_indexes(db):
+    # Email stays globally unique: login resolves the organization from it.
+    await db.users.create_index("email", unique=True)
+    await db.users.create_index([("org_id", 1), ("manager_id", 1)])
+    await db.users.create_index([("org_id", 1), ("role", 1)])
+    await db.feedback.create_index("created_at")
+    await create_feedback_indexes(db.feedback)
+    await db.tags.create_index("name", unique=True)
+    await db.organizations.create_index("invite_code_hash", unique=True)
+    await create_idempotency_indexes(db)
+    await create_archive_indexes(db)
+    await create_feedback_request_indexes(db)
+    await create_job_indexes(db)
+    await profile_store.create_collection(db)
+
+async def create_feedback_indexes(collection):
+    # Owner lookups for both storage layouts, prefixed by organization so
+    # per-tenant queries stay targeted once the collection is sharded.
+    await collection.create_index([("org_id", 1), ("manager_id", 1), ("_id", -1)])
+    await collection.create_index([("org_id", 1), ("employee_id", 1), ("_id", -1)])
+    await collection.create_index([("org_id", 1), ("m", 1), ("_id", -1)])
+    await collection.create_index([("org_id", 1), ("e", 1), ("_id", -1)])
+
 def get_database():
     return database
 
 def get_sync_database():
-    return sync_database
\ No newline at end of file
+    return sync_database
+
+def get_sentiment_pipeline() -> Optional[SentimentPipeline]:
+    return sentiment_pipeline
+
+def get_authz_index() -> Optional[AuthzIndex]:
+    """The authorization index, if enabled and running in this process.
+
+    Only while the change stream is open: without it the index would never
+    hear about writes made by other processes.
+    """
+    if authz_index is None or not authz_index.running:
+        return None
+    if change_stream_watcher is None or not change_stream_watcher.streaming:
+        return None
+    return authz_index
+
+def get_collection(name: str, route: ReadRoute = ReadRoute.primary):
+    """Collection handle whose reads follow the read preference of ``route``."""
+    read_metrics.record_route(route)
+    return database.get_collection(name, read_preference=READ_PREFERENCES[route])
+
+async def start_causal_session():
+    """A causally consistent session, or None when no client is connected."""
+    if client is None:
+        return None
+    return await client.start_session(causal_consistency=True)
+
+async def acquire_lease(name: str, seconds: int, owner: str = WORKER_ID) -> bool:
+    """Claim (or renew) the named lease so only one worker runs a periodic task."""
+    now = datetime.utcnow()
+    try:
+        lease = await database.leases.find_one_and_update(
+            {"_id": name, "$or": [{"expires_at": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return False
+    return lease is not None
+
+async def release_lease(name: str, owner: str = WORKER_ID):
+    await database.leases.delete_one({"_id": name, "owner": owner})
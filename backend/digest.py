@@ -0,0 +1,142 @@
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+from email_utils import render_feedback_digest, send_emails
+from models import FeedbackRequestStatus, UserDB
+
+FEEDBACK_DIGEST_INTERVAL_SECONDS = int(os.getenv("FEEDBACK_DIGEST_INTERVAL_SECONDS", "3600"))
+# A claim older than this is assumed to belong to a worker that died mid-send.
+FEEDBACK_DIGEST_STALE_CLAIM_SECONDS = int(os.getenv("FEEDBACK_DIGEST_STALE_CLAIM_SECONDS", "900"))
+
+
+async def create_feedback_request_indexes(db):
+    await db.feedback_requests.create_index([("org_id", 1), ("manager_id", 1), ("fulfilled_at", 1), ("requested_at", -1)])
+    await db.feedback_requests.create_index([("org_id", 1), ("employee_id", 1), ("manager_id", 1), ("requested_at", -1)])
+    await db.feedback_requests.create_index([("status", 1), ("claimed_at", 1)])
+    # At most one request per pair may wait for the next digest.
+    await db.feedback_requests.create_index(
+        [("employee_id", 1), ("manager_id", 1)],
+        unique=True,
+        partialFilterExpression={"status": FeedbackRequestStatus.pending.value},
+        name="one_pending_request_per_pair"
+    )
+
+
+async def send_pending_digests(db) -> int:
+    """Send every manager with pending requests one digest email.
+
+    Requests are claimed with a per-run id before sending, so a request is
+    only ever picked up by one run. Returns the number of digests sent.
+    """
+    now = datetime.utcnow()
+    claim_id = ObjectId()
+    await db.feedback_requests.update_many(
+        {"$or": [
+            {"status": FeedbackRequestStatus.pending.value},
+            {
+                "status": FeedbackRequestStatus.sending.value,
+                "claimed_at": {"$lt": now - timedelta(seconds=FEEDBACK_DIGEST_STALE_CLAIM_SECONDS)}
+            }
+        ]},
+        {"$set": {"status": FeedbackRequestStatus.sending.value, "claim_id": claim_id, "claimed_at": now}}
+    )
+    claimed = await db.feedback_requests.find({"claim_id": claim_id}).sort("requested_at", 1).to_list(None)
+    if not claimed:
+        return 0
+
+    requests_by_manager = defaultdict(list)
+    for request in claimed:
+        requests_by_manager[str(request["manager_id"])].append(request)
+
+    user_ids = set(requests_by_manager)
+    user_ids.update(str(request["employee_id"]) for request in claimed)
+    users = await UserDB.get_users_by_ids(user_ids)
+
+    digests = []
+    for manager_id, requests in requests_by_manager.items():
+        manager = users.get(manager_id)
+        if manager is None:
+            continue
+        lines = [
+            (users[str(request["employee_id"])].full_name, request["request_count"])
+            for request in requests
+            if users.get(str(request["employee_id"])) is not None
+        ]
+        if not lines:
+            continue
+        subject, body = render_feedback_digest(manager.full_name, lines)
+        digests.append((manager_id, manager.email, subject, body))
+
+    # smtplib blocks, so the whole SMTP session runs off the event loop.
+    results = await asyncio.to_thread(
+        send_emails, [(email, subject, body) for _, email, subject, body in digests]
+    )
+
+    sent_managers = [ObjectId(manager_id) for (manager_id, *_), sent in zip(digests, results) if sent]
+    if sent_managers:
+        await db.feedback_requests.update_many(
+            {"claim_id": claim_id, "manager_id": {"$in": sent_managers}},
+            {"$set": {"status": FeedbackRequestStatus.sent.value, "sent_at": datetime.utcnow()}, "$unset": {"claim_id": ""}}
+        )
+    # Anything left in this claim failed to send; put it back for the next run.
+    # Back-to-pending can collide with a newer pending request for the same pair,
+    # so those are folded into the newer one instead.
+    for request in await db.feedback_requests.find({"claim_id": claim_id}).to_list(None):
+        pair = {"employee_id": request["employee_id"], "manager_id": request["manager_id"]}
+        newer = await db.feedback_requests.find_one_and_update(
+            {**pair, "status": FeedbackRequestStatus.pending.value},
+            {"$inc": {"request_count": request["request_count"]}, "$min": {"requested_at": request["requested_at"]}}
+        )
+        if newer:
+            await db.feedback_requests.delete_one({"_id": request["_id"]})
+        else:
+            await db.feedback_requests.update_one(
+                {"_id": request["_id"]},
+                {"$set": {"status": FeedbackRequestStatus.pending.value}, "$unset": {"claim_id": "", "claimed_at": ""}}
+            )
+
+    return len(sent_managers)
+
+
+class FeedbackDigestScheduler:
+    """Periodically emails managers a digest of pending feedback requests."""
+
+    def __init__(self, db, interval_seconds: int = FEEDBACK_DIGEST_INTERVAL_SECONDS):
+        self.db = db
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        from database import acquire_lease
+
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                if await acquire_lease("feedback_digest", self.interval_seconds):
+                    sent = await send_pending_digests(self.db)
+                    if sent:
+                        print(f"Sent {sent} feedback request digests")
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                print(f"Feedback digest run failed: {e}")
@@ -1,12 +1,44 @@
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from functools import lru_cache
+from string import Template
 import os
-from typing import Optional
+from typing import Optional, List, Tuple
 
-def send_feedback_request_email(manager_email: str, employee_name: str, manager_name: str) -> bool:
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+LOGIN_URL = os.getenv("LOGIN_URL", "https://dpdzero.arhya.codes")
+
+@lru_cache(maxsize=None)
+def load_template(name: str) -> Template:
+    """
+    Load and cache an email template from the templates directory
+    """
+    with open(os.path.join(TEMPLATE_DIR, f"{name}.txt"), encoding="utf-8") as f:
+        return Template(f.read())
+
+def render_feedback_digest(manager_name: str, requests: List[Tuple[str, int]]) -> Tuple[str, str]:
+    """
+    Render the digest subject and body for (employee_name, request_count) pairs
     """
-    Send feedback request email to manager
+    request_lines = "\n".join(
+        f"• {employee_name}" + (f" ({count} requests)" if count > 1 else "")
+        for employee_name, count in requests
+    )
+    if len(requests) == 1:
+        subject = f"Feedback Request from {requests[0][0]}"
+    else:
+        subject = f"{len(requests)} Feedback Requests from your team"
+    body = load_template("feedback_digest").substitute(
+        manager_name=manager_name,
+        request_lines=request_lines,
+        login_url=LOGIN_URL
+    )
+    return subject, body
+
+def send_emails(messages: List[Tuple[str, str, str]]) -> List[bool]:
+    """
+    Send (to_email, subject, body) messages over a single SMTP session
     """
     try:
         # Email configuration - you'll need to set these environment variables
@@ -18,40 +50,33 @@ def send_feedback_request_email(manager_email: str, employee_name: str, manager_
         
         if not smtp_username or not smtp_password:
             print("SMTP credentials not configured")
-            return False
-        
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = from_email
-        msg['To'] = manager_email
-        msg['Subject'] = f"Feedback Request from {employee_name}"
+            return [False] * len(messages)
         
-        # Email body
-        body = f"""
-Dear {manager_name},
-
-{employee_name} has requested feedback from you through the Feedback App.
-
-Please log in to the feedback system to provide your valuable feedback:
-🔗 Login Link: https://dpdzero.arhya.codes
-
-Your feedback helps in professional growth and development.
-
-Best regards,
-Feedback App Team
-        """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Send email
         server = smtplib.SMTP(smtp_server, smtp_port)
         server.starttls()
         server.login(smtp_username, smtp_password)
-        server.send_message(msg)
-        server.quit()
-        
-        return True
-        
     except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
\ No newline at end of file
+        print(f"Error connecting to SMTP server: {e}")
+        return [False] * len(messages)
+
+    results = []
+    try:
+        for to_email, subject, body in messages:
+            try:
+                msg = MIMEMultipart()
+                msg['From'] = from_email
+                msg['To'] = to_email
+                msg['Subject'] = subject
+                msg.attach(MIMEText(body, 'plain'))
+                server.send_message(msg)
+                results.append(True)
+            except Exception as e:
+                print(f"Error sending email to {to_email}: {e}")
+                results.append(False)
+    finally:
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+    return results
\ No newline at end of file
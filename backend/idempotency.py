@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional
+
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import DuplicateKeyError
+
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "2048"))
+# A pending key whose claim is older than this is assumed to belong to a
+# worker that died mid-request, and the next retry takes it over.
+IDEMPOTENCY_CLAIM_SECONDS = int(os.getenv("IDEMPOTENCY_CLAIM_SECONDS", "30"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+class _ResponseCache:
+    """Small LRU of completed responses so hot retries skip the database."""
+
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, record_id: str) -> Optional[dict]:
+        entry = self._entries.get(record_id)
+        if entry is None:
+            return None
+        expires_at, record = entry
+        if expires_at < time.monotonic():
+            del self._entries[record_id]
+            return None
+        self._entries.move_to_end(record_id)
+        return record
+
+    def put(self, record_id: str, record: dict, created_at: datetime):
+        age = (datetime.utcnow() - created_at).total_seconds()
+        remaining = self.ttl_seconds - age
+        if remaining <= 0 or self.max_size <= 0:
+            return
+        self._entries[record_id] = (time.monotonic() + remaining, record)
+        self._entries.move_to_end(record_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+_cache = _ResponseCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_KEY_TTL_SECONDS)
+
+
+async def create_idempotency_indexes(db):
+    await db.idempotency_keys.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_KEY_TTL_SECONDS)
+
+
+def _fingerprint(payload: Any) -> str:
+    encoded = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _check_fingerprint(record: dict, fingerprint: str):
+    if record["request_hash"] != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used with a different request"
+        )
+
+
+def _replay(record: dict, fingerprint: str) -> Any:
+    _check_fingerprint(record, fingerprint)
+    return record["response"]
+
+
+async def run_idempotent(
+    key: Optional[str],
+    user_id: str,
+    operation: str,
+    payload: Any,
+    handler: Callable[[], Awaitable[Any]]
+) -> Any:
+    """Run ``handler`` at most once per (user, operation, Idempotency-Key).
+
+    Without a key the handler simply runs. With one, the first call claims the
+    key in ``idempotency_keys`` and stores the response; retries get the stored
+    response back (from the in-memory cache when possible) instead of writing
+    again. A failed handler releases the key so the client can retry, and a
+    claim left pending past ``IDEMPOTENCY_CLAIM_SECONDS`` (the worker died) is
+    taken over by the next retry.
+    """
+    if not key:
+        return await handler()
+
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+    from database import get_database
+    db = get_database()
+
+    record_id = f"{user_id}:{operation}:{key}"
+    fingerprint = _fingerprint(payload)
+
+    cached = _cache.get(record_id)
+    if cached is not None:
+        return _replay(cached, fingerprint)
+
+    now = created_at = datetime.utcnow()
+    claim = ObjectId()
+    try:
+        await db.idempotency_keys.insert_one({
+            "_id": record_id,
+            "user_id": user_id,
+            "operation": operation,
+            "request_hash": fingerprint,
+            "status": "pending",
+            "claim": claim,
+            "claimed_until": now + timedelta(seconds=IDEMPOTENCY_CLAIM_SECONDS),
+            "created_at": now
+        })
+    except DuplicateKeyError:
+        record = await db.idempotency_keys.find_one({"_id": record_id})
+        if record is None:
+            # Expired between the insert and the read; treat as a fresh request.
+            return await run_idempotent(key, user_id, operation, payload, handler)
+        if record["status"] == "completed":
+            _cache.put(record_id, record, record["created_at"])
+            return _replay(record, fingerprint)
+        _check_fingerprint(record, fingerprint)
+        claimed_until = record.get("claimed_until") or record["created_at"] + timedelta(seconds=IDEMPOTENCY_CLAIM_SECONDS)
+        if claimed_until > now:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still being processed"
+            )
+        # Take over the stale claim; only one retry can swap the claim it saw.
+        taken = await db.idempotency_keys.find_one_and_update(
+            {"_id": record_id, "status": "pending", "claim": record.get("claim")},
+            {"$set": {"claim": claim, "claimed_until": now + timedelta(seconds=IDEMPOTENCY_CLAIM_SECONDS)}}
+        )
+        if taken is None:
+            # Another retry took it over or it completed meanwhile.
+            return await run_idempotent(key, user_id, operation, payload, handler)
+        created_at = record["created_at"]
+
+    try:
+        response = await handler()
+    except BaseException:
+        await db.idempotency_keys.delete_one({"_id": record_id, "status": "pending", "claim": claim})
+        raise
+
+    encoded_response = jsonable_encoder(response)
+    await db.idempotency_keys.update_one(
+        {"_id": record_id, "claim": claim},
+        {"$set": {"status": "completed", "response": encoded_response}}
+    )
+    _cache.put(record_id, {"request_hash": fingerprint, "response": encoded_response}, created_at)
+    return response
@@ -0,0 +1,210 @@
+import asyncio
+import enum
+import inspect
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pydantic import BaseModel, Field
+from pymongo.errors import OperationFailure, PyMongoError
+
+WATCHED_COLLECTIONS = ["users", "feedback"]
+# Each worker keeps its own resume token, so the default is unique per
+# process; set a stable id per worker to resume across restarts.
+CHANGE_STREAM_CONSUMER = os.getenv("CHANGE_STREAM_CONSUMER", f"{socket.gethostname()}-{os.getpid()}")
+RESUME_TOKEN_FLUSH_SECONDS = float(os.getenv("RESUME_TOKEN_FLUSH_SECONDS", "1"))
+
+# Server error codes that mean the stored resume token can no longer be used
+# (oplog rolled past it) or that change streams are unavailable altogether.
+CHANGE_STREAM_HISTORY_LOST = 286
+CHANGE_STREAM_FATAL_ERROR = 280
+NOT_A_REPLICA_SET = 40573
+
+
+class InvalidationType(str, enum.Enum):
+    insert = "insert"
+    update = "update"
+    replace = "replace"
+    delete = "delete"
+    # Subscribers must drop everything they hold: the stream was restarted
+    # without a usable resume token, so changes may have been missed.
+    flush = "flush"
+
+
+class InvalidationEvent(BaseModel):
+    type: InvalidationType
+    collection: Optional[str] = None
+    document_id: Optional[str] = None
+    updated_fields: Dict[str, Any] = Field(default_factory=dict)
+    removed_fields: List[str] = Field(default_factory=list)
+    document: Optional[Dict[str, Any]] = None
+    received_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class InvalidationBus:
+    """Fan-out of invalidation events to in-process subscribers."""
+
+    def __init__(self):
+        self._subscribers: Dict[Optional[str], List[Callable]] = {}
+
+    def subscribe(self, callback: Callable, collection: Optional[str] = None) -> Callable:
+        """Register ``callback`` for one collection, or every collection when None.
+
+        Flush events are delivered to all subscribers regardless of collection.
+        """
+        self._subscribers.setdefault(collection, []).append(callback)
+        return callback
+
+    def unsubscribe(self, callback: Callable, collection: Optional[str] = None):
+        callbacks = self._subscribers.get(collection, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    async def publish(self, event: InvalidationEvent):
+        if event.type == InvalidationType.flush:
+            targets = [cb for callbacks in self._subscribers.values() for cb in callbacks]
+        else:
+            targets = self._subscribers.get(None, []) + self._subscribers.get(event.collection, [])
+
+        for callback in list(targets):
+            try:
+                result = callback(event)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"Invalidation subscriber {callback!r} failed: {e}")
+
+
+bus = InvalidationBus()
+
+
+def _event_from_change(change: dict) -> Optional[InvalidationEvent]:
+    operation = change.get("operationType")
+    if operation not in InvalidationType.__members__:
+        return None
+
+    document_key = change.get("documentKey") or {}
+    document_id = document_key.get("_id")
+    update_description = change.get("updateDescription") or {}
+
+    return InvalidationEvent(
+        type=InvalidationType(operation),
+        collection=(change.get("ns") or {}).get("coll"),
+        document_id=str(document_id) if isinstance(document_id, ObjectId) else document_id,
+        updated_fields=update_description.get("updatedFields") or {},
+        removed_fields=update_description.get("removedFields") or [],
+        document=change.get("fullDocument"),
+    )
+
+
+class ChangeStreamWatcher:
+    """Tails the change stream of the watched collections and feeds ``bus``.
+
+    The last resume token is persisted in ``change_stream_tokens`` so a
+    restarted process picks up where it stopped instead of missing writes
+    made while it was down.
+    """
+
+    def __init__(self, db, consumer: str = CHANGE_STREAM_CONSUMER, event_bus: InvalidationBus = bus):
+        self.db = db
+        self.consumer = consumer
+        self.bus = event_bus
+        self.resume_token = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_flush = 0.0
+        self._dirty = False
+        # True while a stream is open, i.e. while this process hears about
+        # writes made by other processes.
+        self.streaming = False
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._save_resume_token(force=True)
+
+    async def _load_resume_token(self):
+        state = await self.db.change_stream_tokens.find_one({"_id": self.consumer})
+        if state:
+            self.resume_token = state.get("resume_token")
+
+    async def _save_resume_token(self, force: bool = False):
+        if not self._dirty or self.resume_token is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < RESUME_TOKEN_FLUSH_SECONDS:
+            return
+        try:
+            await self.db.change_stream_tokens.update_one(
+                {"_id": self.consumer},
+                {"$set": {"resume_token": self.resume_token, "updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+            self._last_flush = now
+            self._dirty = False
+        except PyMongoError as e:
+            print(f"Failed to persist change stream resume token: {e}")
+
+    async def _run(self):
+        await self._load_resume_token()
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": WATCHED_COLLECTIONS},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        }}]
+        backoff = 1
+
+        while True:
+            try:
+                async with self.db.watch(pipeline, resume_after=self.resume_token) as stream:
+                    self.streaming = True
+                    backoff = 1
+                    while True:
+                        change = await stream.try_next()
+                        if change is None:
+                            # Idle: keep the stored token moving with the
+                            # post-batch token so a resume stays cheap.
+                            if stream.resume_token is not None and stream.resume_token != self.resume_token:
+                                self.resume_token = stream.resume_token
+                                self._dirty = True
+                            await self._save_resume_token()
+                            continue
+
+                        event = _event_from_change(change)
+                        if event is not None:
+                            await self.bus.publish(event)
+                        self.resume_token = change["_id"]
+                        self._dirty = True
+                        await self._save_resume_token()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == NOT_A_REPLICA_SET:
+                    print("Change streams require a replica set; cache invalidation watcher disabled")
+                    return
+                if e.code in (CHANGE_STREAM_HISTORY_LOST, CHANGE_STREAM_FATAL_ERROR) and self.resume_token is not None:
+                    print("Change stream resume token expired; restarting stream and flushing caches")
+                    self.resume_token = None
+                    self._dirty = False
+                    await self.db.change_stream_tokens.delete_one({"_id": self.consumer})
+                    await self.bus.publish(InvalidationEvent(type=InvalidationType.flush))
+                    continue
+                print(f"Change stream failed: {e}")
+            except PyMongoError as e:
+                print(f"Change stream interrupted: {e}")
+            finally:
+                self.streaming = False
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
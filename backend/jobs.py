@@ -0,0 +1,394 @@
+import asyncio
+import enum
+import os
+import traceback
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from bson import ObjectId
+from pydantic import BaseModel, Field
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from models import PyObjectId, FEEDBACK_FORMAT_COMPACT
+
+JOB_RUNNER_ENABLED = os.getenv("JOB_RUNNER_ENABLED", "1") == "1"
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "2"))
+# A job whose lease is not renewed within this time is handed to another worker.
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Finished jobs are removed after this many days.
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "30"))
+
+
+class JobStatus(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class Job(BaseModel):
+    id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
+    type: str
+    params: Dict[str, Any] = {}
+    status: JobStatus = JobStatus.queued
+    attempts: int = 0
+    max_attempts: int = JOB_MAX_ATTEMPTS
+    progress: Dict[str, Any] = {}
+    checkpoint: Optional[Dict[str, Any]] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_by: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+
+class JobLeaseLost(Exception):
+    """The job was taken over by another worker after our lease expired."""
+
+
+class JobContext:
+    """What a running handler sees of its job: parameters, checkpoint and progress."""
+
+    def __init__(self, db, job: dict, owner: str):
+        self.db = db
+        self.job_id = job["_id"]
+        self.params: Dict[str, Any] = job.get("params") or {}
+        # Saved by an earlier attempt; handlers resume from here when set.
+        self.checkpoint: Optional[Dict[str, Any]] = job.get("checkpoint")
+        self.owner = owner
+
+    async def save_progress(self, checkpoint: Optional[Dict[str, Any]] = None, done: Optional[int] = None, total: Optional[int] = None):
+        """Persist progress, and a checkpoint to resume from if this attempt dies."""
+        changes: Dict[str, Any] = {
+            "updated_at": datetime.utcnow(),
+            "lease_expires_at": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+        }
+        if checkpoint is not None:
+            changes["checkpoint"] = checkpoint
+            self.checkpoint = checkpoint
+        if done is not None:
+            changes["progress.done"] = done
+        if total is not None:
+            changes["progress.total"] = total
+        result = await self.db.jobs.update_one({"_id": self.job_id, "lease_owner": self.owner}, {"$set": changes})
+        if result.matched_count == 0:
+            raise JobLeaseLost(str(self.job_id))
+
+
+class JobType(NamedTuple):
+    handler: Callable[[Any, JobContext], Awaitable[Optional[dict]]]
+    # Most jobs of this type running at once across all workers.
+    concurrency: int
+
+
+JOB_TYPES: Dict[str, JobType] = {}
+
+
+def job_handler(name: str, concurrency: int = 1):
+    def register(handler):
+        JOB_TYPES[name] = JobType(handler, concurrency)
+        return handler
+    return register
+
+
+async def create_job_indexes(db):
+    await db.jobs.create_index([("type", 1), ("status", 1), ("created_at", 1)])
+    await db.jobs.create_index([("status", 1), ("created_at", -1)])
+    await db.jobs.create_index("finished_at", expireAfterSeconds=JOB_RETENTION_DAYS * 86400)
+
+
+async def enqueue_job(db, job_type: str, params: Optional[Dict[str, Any]] = None, created_by: Optional[str] = None) -> Job:
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Unknown job type: {job_type}")
+    job = Job(type=job_type, params=params or {}, created_by=created_by)
+    # Unset rather than null fields, so "$min" can fill in started_at.
+    await db.jobs.insert_one(job.dict(by_alias=True, exclude_none=True))
+    return job
+
+
+async def get_job(db, job_id: str) -> Optional[Job]:
+    if not ObjectId.is_valid(job_id):
+        return None
+    job_data = await db.jobs.find_one({"_id": ObjectId(job_id)})
+    return Job(**job_data) if job_data else None
+
+
+async def list_jobs(db, status: Optional[JobStatus] = None, job_type: Optional[str] = None, limit: int = 50) -> List[Job]:
+    query: Dict[str, Any] = {}
+    if status is not None:
+        query["status"] = status.value
+    if job_type is not None:
+        query["type"] = job_type
+    cursor = db.jobs.find(query).sort("created_at", -1).limit(limit)
+    return [Job(**job_data) async for job_data in cursor]
+
+
+def _claimable(job_type: str, now: datetime) -> dict:
+    return {
+        "type": job_type,
+        "$or": [
+            {"status": JobStatus.queued.value},
+            # Running, but its worker stopped renewing the lease.
+            {"status": JobStatus.running.value, "lease_expires_at": {"$lt": now}}
+        ]
+    }
+
+
+class JobRunner:
+    """Runs queued jobs on this worker, sharing the queue with every other worker.
+
+    Each job type has ``concurrency`` slots, held as leases named
+    ``job:<type>:<n>``, so the limit holds across all workers. A running job
+    and its slot are renewed by a heartbeat; if a worker dies, both expire and
+    another worker picks the job up again from its last checkpoint.
+    """
+
+    def __init__(self, db, poll_interval_seconds: float = JOB_POLL_INTERVAL_SECONDS):
+        self.db = db
+        self.poll_interval_seconds = poll_interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._running: Dict[asyncio.Task, str] = {}
+
+    def start(self):
+        if JOB_RUNNER_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        tasks = [self._task, *self._running]
+        for task in self._running:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._running.clear()
+
+    async def _run(self):
+        while True:
+            try:
+                for job_type in JOB_TYPES:
+                    while await self._start_next(job_type):
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                print(f"Job polling failed: {e}")
+            await asyncio.sleep(self.poll_interval_seconds)
+
+    async def _start_next(self, job_type: str) -> bool:
+        from database import WORKER_ID, acquire_lease, release_lease
+
+        job_type_info = JOB_TYPES[job_type]
+        if sum(1 for running_type in self._running.values() if running_type == job_type) >= job_type_info.concurrency:
+            return False
+        if await self.db.jobs.find_one(_claimable(job_type, datetime.utcnow()), {"_id": 1}) is None:
+            return False
+
+        owner = f"{WORKER_ID}:{ObjectId()}"
+        slot = None
+        for index in range(job_type_info.concurrency):
+            name = f"job:{job_type}:{index}"
+            if await acquire_lease(name, JOB_LEASE_SECONDS, owner):
+                slot = name
+                break
+        if slot is None:
+            return False
+
+        now = datetime.utcnow()
+        job = await self.db.jobs.find_one_and_update(
+            _claimable(job_type, now),
+            {
+                "$set": {
+                    "status": JobStatus.running.value,
+                    "lease_owner": owner,
+                    "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "updated_at": now
+                },
+                "$min": {"started_at": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            await release_lease(slot, owner)
+            return False
+
+        task = asyncio.create_task(self._execute(job, owner, slot))
+        self._running[task] = job_type
+        task.add_done_callback(self._running.pop)
+        return True
+
+    async def _execute(self, job: dict, owner: str, slot: str):
+        from database import release_lease
+
+        if job["attempts"] > job.get("max_attempts", JOB_MAX_ATTEMPTS):
+            await self._finish(job, owner, JobStatus.failed, error="Exceeded max attempts")
+            await release_lease(slot, owner)
+            return
+
+        context = JobContext(self.db, job, owner)
+        handler_task = asyncio.create_task(JOB_TYPES[job["type"]].handler(self.db, context))
+        heartbeat = asyncio.create_task(self._heartbeat(job["_id"], owner, slot, handler_task))
+        try:
+            result = await handler_task
+        except asyncio.CancelledError:
+            if heartbeat.done():
+                print(f"Job {job['_id']} lost its lease")
+            else:
+                # Shutting down: hand the job back without counting the attempt.
+                await self.db.jobs.update_one(
+                    {"_id": job["_id"], "lease_owner": owner},
+                    {
+                        "$set": {"status": JobStatus.queued.value, "updated_at": datetime.utcnow()},
+                        "$unset": {"lease_owner": "", "lease_expires_at": ""},
+                        "$inc": {"attempts": -1}
+                    }
+                )
+                raise
+        except JobLeaseLost:
+            print(f"Job {job['_id']} lost its lease")
+        except Exception as e:
+            print(f"Job {job['_id']} ({job['type']}) failed: {e}")
+            retry = job["attempts"] < job.get("max_attempts", JOB_MAX_ATTEMPTS)
+            await self._finish(
+                job, owner, JobStatus.queued if retry else JobStatus.failed,
+                error="".join(traceback.format_exception_only(type(e), e)).strip()
+            )
+        else:
+            await self._finish(job, owner, JobStatus.succeeded, result=result)
+        finally:
+            heartbeat.cancel()
+            await release_lease(slot, owner)
+
+    async def _heartbeat(self, job_id: ObjectId, owner: str, slot: str, handler_task: asyncio.Task):
+        from database import acquire_lease
+
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            now = datetime.utcnow()
+            result = await self.db.jobs.update_one(
+                {"_id": job_id, "lease_owner": owner},
+                {"$set": {"lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS)}}
+            )
+            if result.matched_count == 0:
+                handler_task.cancel()
+                return
+            await acquire_lease(slot, JOB_LEASE_SECONDS, owner)
+
+    async def _finish(self, job: dict, owner: str, status: JobStatus, result: Optional[dict] = None, error: Optional[str] = None):
+        now = datetime.utcnow()
+        changes: Dict[str, Any] = {"status": status.value, "updated_at": now, "error": error}
+        if status != JobStatus.queued:
+            changes["finished_at"] = now
+            changes["result"] = result
+        await self.db.jobs.update_one(
+            {"_id": job["_id"], "lease_owner": owner},
+            {"$set": changes, "$unset": {"lease_owner": "", "lease_expires_at": ""}}
+        )
+
+
+@job_handler("reindex")
+async def reindex_job(db, context: JobContext):
+    from database import create_indexes
+    await create_indexes(db)
+    return {"collections": sorted(await db.list_collection_names())}
+
+
+@job_handler("archive_feedback")
+async def archive_feedback_job(db, context: JobContext):
+    from archive import archive_old_feedback
+    return {"moved": await archive_old_feedback(db)}
+
+
+@job_handler("send_feedback_digests")
+async def send_feedback_digests_job(db, context: JobContext):
+    from digest import send_pending_digests
+    return {"sent": await send_pending_digests(db)}
+
+
+@job_handler("backfill_org")
+async def backfill_org_job(db, context: JobContext):
+    from migrate_tenancy import backfill
+    from models import DEFAULT_ORG_ID
+    await backfill(db, context.params.get("org_id", DEFAULT_ORG_ID))
+
+
+@job_handler("reconcile_tag_counter")
+async def reconcile_tag_counter_job(db, context: JobContext):
+    """Raise the tag id counter past every interned tag, e.g. after a restore."""
+    highest = await db.tags.find_one({}, sort=[("_id", -1)])
+    seq = highest["_id"] if highest else 0
+    await db.counters.update_one({"_id": "tags"}, {"$max": {"seq": seq}}, upsert=True)
+    return {"seq": seq}
+
+
+@job_handler("migrate_feedback_storage")
+async def migrate_feedback_storage_job(db, context: JobContext):
+    """Resumable version of ``migrate_feedback_storage.py migrate``/``rollback``.
+
+    The checkpoint records the collection and last ``_id`` converted, so a
+    retried attempt continues after the last finished batch.
+    """
+    from migrate_feedback_storage import COLLECTIONS, convert
+
+    target_format = int(context.params.get("target_format", FEEDBACK_FORMAT_COMPACT))
+    batch_size = int(context.params.get("batch_size", 500))
+    checkpoint = context.checkpoint or {}
+    converted = checkpoint.get("converted", 0)
+    first = COLLECTIONS.index(checkpoint["collection"]) if checkpoint.get("collection") in COLLECTIONS else 0
+
+    for collection_name in COLLECTIONS[first:]:
+        start_after = checkpoint.get("last_id") if collection_name == checkpoint.get("collection") else None
+
+        async def on_batch(last_id, count, collection_name=collection_name, base=converted):
+            await context.save_progress(
+                {"collection": collection_name, "last_id": last_id, "converted": base + count},
+                done=base + count
+            )
+
+        converted += await convert(db, collection_name, target_format, batch_size, start_after, on_batch)
+    return {"converted": converted}
+
+
+@job_handler("classify_sentiment")
+async def classify_sentiment_job(db, context: JobContext):
+    """Backfill sentiment predictions; ``reclassify`` redoes existing ones too.
+
+    The result counts feedback whose predicted sentiment differs from the
+    one its author picked.
+    """
+    from sentiment import SENTIMENT_BATCH_SIZE, backfill_sentiment, create_executor
+
+    reclassify = bool(context.params.get("reclassify", False))
+    batch_size = int(context.params.get("batch_size", SENTIMENT_BATCH_SIZE))
+    checkpoint = context.checkpoint or {}
+    totals = {"classified": checkpoint.get("classified", 0), "disagreements": checkpoint.get("disagreements", 0)}
+    collections = ["feedback", "feedback_archive"]
+    first = collections.index(checkpoint["collection"]) if checkpoint.get("collection") in collections else 0
+
+    executor = create_executor()
+    try:
+        for collection_name in collections[first:]:
+            start_after = checkpoint.get("last_id") if collection_name == checkpoint.get("collection") else None
+            base = dict(totals)
+
+            async def on_batch(last_id, counts, collection_name=collection_name, base=base):
+                progress = {key: base[key] + counts[key] for key in base}
+                await context.save_progress({"collection": collection_name, "last_id": last_id, **progress}, done=progress["classified"])
+
+            counts = await backfill_sentiment(db, collection_name, executor, reclassify, batch_size, start_after, on_batch)
+            totals = {key: base[key] + counts[key] for key in base}
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return totals
@@ -1,16 +1,24 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Response
+from fastapi.security import HTTPBearer
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime, timedelta
+from fastapi.responses import PlainTextResponse
+from starlette.datastructures import Headers, MutableHeaders
+from datetime import datetime
 from passlib.context import CryptContext
-import os
+import asyncio
 from typing import Optional, List
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
-from database import connect_to_mongo, close_mongo_connection
-from models import User, Feedback, UserDB, FeedbackDB, UserRole, SentimentType
-from schemas import UserCreate, UserLogin, UserResponse, FeedbackCreate, FeedbackResponse, FeedbackUpdate, FeedbackAcknowledge
-from auth import create_access_token, verify_token, get_current_user
+from database import connect_to_mongo, close_mongo_connection, get_database, get_authz_index
+from models import User, Feedback, UserDB, OrganizationDB, FeedbackDB, FeedbackRequestDB, UserRole, DEFAULT_ORG_ID, begin_request_scope, end_request_scope, get_request_scope, gather_limited
+from schemas import UserCreate, UserLogin, UserResponse, FeedbackCreate, FeedbackResponse, FeedbackUpdate, FeedbackAcknowledge, FeedbackRequestResponse, DashboardResponse, JobCreate, JobResponse, OrganizationCreate, OrganizationResponse
+from auth import create_access_token, get_current_user, get_admin_user
+from idempotency import run_idempotent
+from jobs import Job, JobStatus, enqueue_job, get_job, list_jobs
+from compression import CachePolicyMiddleware, CompressionMiddleware
+from profiling import PROFILING_HEADER, ProfilingMiddleware, profile_store, profiling_enabled
+from read_routing import CAUSAL_TOKEN_HEADER, decode_causal_token, encode_causal_token, read_metrics
 
 app = FastAPI(title="Feedback App", version="1.0.0")
 
@@ -25,12 +33,55 @@ app.add_middleware(
         "Content-Language",
         "Content-Type",
         "Authorization",
-        "X-Requested-With"
+        "X-Requested-With",
+        "Idempotency-Key",
+        "If-Match",
+        PROFILING_HEADER,
+        CAUSAL_TOKEN_HEADER
     ],
-    expose_headers=["*"],
+    # "*" is taken literally on credentialed requests, so headers the
+    # frontend reads are also listed by name.
+    expose_headers=["*", CAUSAL_TOKEN_HEADER, "ETag"],
     max_age=600,  
 )
 
+class RequestScopeMiddleware:
+    """Gives every HTTP request its own user identity map and query concurrency cap.
+
+    Also carries causal consistency across requests: a client that sends back
+    the X-Causal-Token of its last write gets reads that include that write.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = begin_request_scope()
+        request_scope = get_request_scope()
+        request_scope.causal_token = decode_causal_token(Headers(scope=scope).get(CAUSAL_TOKEN_HEADER))
+
+        async def send_with_causal_token(message):
+            if message["type"] == "http.response.start" and request_scope.operation_time is not None:
+                MutableHeaders(scope=message)[CAUSAL_TOKEN_HEADER] = encode_causal_token(request_scope.operation_time)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_causal_token)
+        finally:
+            await request_scope.close()
+            end_request_scope(token)
+
+app.add_middleware(RequestScopeMiddleware)
+app.add_middleware(CachePolicyMiddleware)
+app.add_middleware(CompressionMiddleware)
+if profiling_enabled():
+    # Outermost, so profiles include the other middlewares. Not installed at
+    # all unless configured, so there is no per-request cost otherwise.
+    app.add_middleware(ProfilingMiddleware)
+
 security = HTTPBearer()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -51,11 +102,32 @@ async def register(user: UserCreate):
             detail="Email already registered"
         )
     
+    # The organization comes only from an admin-issued invite code; without
+    # one users join the default organization. A manager is looked up inside
+    # that organization, so knowing a user id elsewhere grants nothing.
+    org_id = DEFAULT_ORG_ID
+    if user.invite_code:
+        organization = await OrganizationDB.get_organization_by_invite(user.invite_code)
+        if not organization:
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid invite code"
+            )
+        org_id = organization["_id"]
+    if user.manager_id:
+        manager = await UserDB.get_manager_in_org(user.manager_id, org_id)
+        if not manager:
+            raise HTTPException(
+                status_code=400,
+                detail="Manager not found"
+            )
+    
     hashed_password = pwd_context.hash(user.password)
     user_data = {
         "email": user.email,
         "full_name": user.full_name,
         "role": user.role,
+        "org_id": org_id,
         "manager_id": ObjectId(user.manager_id) if user.manager_id else None,
         "hashed_password": hashed_password
     }
@@ -80,7 +152,7 @@ async def login(user: UserLogin):
             detail="Invalid credentials"
         )
     
-    access_token = create_access_token(data={"sub": str(db_user.id)})
+    access_token = create_access_token(data={"sub": str(db_user.id), "org": db_user.org_id})
     
     return {
         "access_token": access_token,
@@ -104,17 +176,20 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
         manager_id=str(current_user.manager_id) if current_user.manager_id else None
     )
 
-@app.get("/api/team", response_model=List[UserResponse])
-async def get_team_members(current_user: User = Depends(get_current_user)):
+async def get_team_for(current_user: User) -> List[User]:
     if current_user.role == UserRole.manager:
-        team_members = await UserDB.get_team_members(str(current_user.id))
+        return await UserDB.get_team_members(str(current_user.id))
     elif current_user.role == UserRole.employee:
         if not current_user.manager_id:
             return []
         team_members = await UserDB.get_team_members(str(current_user.manager_id))
-        team_members = [member for member in team_members if str(member.id) != str(current_user.id)]
+        return [member for member in team_members if str(member.id) != str(current_user.id)]
     else:
         raise HTTPException(status_code=403, detail="Invalid user role")
+
+@app.get("/api/team", response_model=List[UserResponse])
+async def get_team_members(current_user: User = Depends(get_current_user)):
+    team_members = await get_team_for(current_user)
     
     return [
         UserResponse(
@@ -130,8 +205,35 @@ async def get_team_members(current_user: User = Depends(get_current_user)):
 @app.post("/api/feedback", response_model=FeedbackResponse)
 async def create_feedback(
     feedback: FeedbackCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
+    return await run_idempotent(
+        idempotency_key,
+        str(current_user.id),
+        "create_feedback",
+        feedback.dict(),
+        lambda: _create_feedback(feedback, current_user)
+    )
+
+def _may_give_feedback(current_user: User, employee_id: str, employee_manager_id: Optional[str]) -> bool:
+    if current_user.role == UserRole.manager:
+        return str(employee_manager_id) == str(current_user.id)
+    if current_user.role == UserRole.employee:
+        return str(employee_manager_id) == str(current_user.manager_id) and employee_id != str(current_user.id)
+    return True
+
+async def _create_feedback(feedback: FeedbackCreate, current_user: User) -> FeedbackResponse:
+    index = get_authz_index()
+    if index is not None:
+        known, employee_manager_id = index.user_manager(feedback.employee_id, current_user.org_id)
+        if known and _may_give_feedback(current_user, feedback.employee_id, employee_manager_id):
+            # Authorized from the index, which may trail a manager change made
+            # by another worker by the change stream lag (bounded by
+            # AUTHZ_INDEX_MAX_AGE_SECONDS). The employee's name is fetched
+            # alongside the write instead of before it.
+            return await _insert_feedback(feedback, current_user, UserDB.get_user_by_id(feedback.employee_id))
+
     employee = await UserDB.get_user_by_id(feedback.employee_id)
     if not employee:
         raise HTTPException(
@@ -162,7 +264,12 @@ async def create_feedback(
                 detail="Only employees can give anonymous feedback"
             )
     
+    return await _insert_feedback(feedback, current_user, employee)
+
+async def _insert_feedback(feedback: FeedbackCreate, current_user: User, employee) -> FeedbackResponse:
+    """Store authorized feedback; ``employee`` is the receiver or an awaitable fetching it."""
     feedback_data = {
+        "org_id": current_user.org_id,
         "manager_id": ObjectId(str(current_user.id)),
         "employee_id": ObjectId(feedback.employee_id),
         "strengths": feedback.strengths,
@@ -172,7 +279,14 @@ async def create_feedback(
         "anonymous": feedback.anonymous
     }
     
-    db_feedback = await FeedbackDB.create_feedback(feedback_data)
+    writes = [FeedbackDB.create_feedback(feedback_data)]
+    if current_user.role == UserRole.manager:
+        # Feedback from the manager answers any open request from this employee.
+        writes.append(FeedbackRequestDB.fulfill_requests(str(current_user.id), feedback.employee_id))
+    if isinstance(employee, User):
+        db_feedback, *_ = await gather_limited(*writes)
+    else:
+        db_feedback, *_, employee = await gather_limited(*writes, employee)
     
     return FeedbackResponse(
         id=str(db_feedback.id),
@@ -188,24 +302,25 @@ async def create_feedback(
         acknowledgment_comment=db_feedback.acknowledgment_comment,
         created_at=db_feedback.created_at,
         updated_at=db_feedback.updated_at,
+        version=db_feedback.version,
+        predicted_sentiment=db_feedback.predicted_sentiment,
+        sentiment_confidence=db_feedback.sentiment_confidence,
         giver_name="Anonymous" if db_feedback.anonymous else current_user.full_name,
-        receiver_name=employee.full_name,
+        receiver_name=employee.full_name if employee else "",
         giver_role=current_user.role
     )
 
-@app.get("/api/feedback", response_model=List[FeedbackResponse])
-async def get_feedback(current_user: User = Depends(get_current_user)):
-    if current_user.role == UserRole.manager:
-        feedback_list = await FeedbackDB.get_feedback_by_manager(str(current_user.id))
-    else:
-        feedback_list = await FeedbackDB.get_feedback_by_employee(str(current_user.id))
-    
+async def build_feedback_responses(feedback_list: List[Feedback]) -> List[FeedbackResponse]:
+    user_ids = set()
+    for feedback in feedback_list:
+        user_ids.add(str(feedback.manager_id))
+        user_ids.add(str(feedback.employee_id))
+    users = await UserDB.get_users_by_ids(user_ids)
+
     result = []
     for feedback in feedback_list:
-        manager = await UserDB.get_user_by_id(str(feedback.manager_id))
-        print("Man",str(feedback.manager_id))
-        employee = await UserDB.get_user_by_id(str(feedback.employee_id))
-        print("Employee",str(feedback.employee_id))
+        manager = users.get(str(feedback.manager_id))
+        employee = users.get(str(feedback.employee_id))
         
         result.append(FeedbackResponse(
             id=str(feedback.id),
@@ -221,6 +336,9 @@ async def get_feedback(current_user: User = Depends(get_current_user)):
             acknowledgment_comment=feedback.acknowledgment_comment,
             created_at=feedback.created_at,
             updated_at=feedback.updated_at,
+            version=feedback.version,
+            predicted_sentiment=feedback.predicted_sentiment,
+            sentiment_confidence=feedback.sentiment_confidence,
             giver_name="Anonymous" if feedback.anonymous else (manager.full_name if manager else ""),  
             receiver_name=employee.full_name if employee else "",  
             giver_role=manager.role if manager else UserRole.employee  
@@ -228,23 +346,43 @@ async def get_feedback(current_user: User = Depends(get_current_user)):
     
     return result
 
+@app.get("/api/feedback", response_model=List[FeedbackResponse])
+async def get_feedback(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role == UserRole.manager:
+        feedback_list = await FeedbackDB.get_feedback_by_manager(str(current_user.id), since, until)
+    else:
+        feedback_list = await FeedbackDB.get_feedback_by_employee(str(current_user.id), since, until)
+    
+    return await build_feedback_responses(feedback_list)
+
+def feedback_etag(feedback: Feedback) -> str:
+    return f'"{feedback.version}"'
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Version required by an If-Match header; None when any version will do."""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.split(",")[0].strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        # Not one of our ETags, so it cannot match any version.
+        return -1
+
 @app.put("/api/feedback/{feedback_id}", response_model=FeedbackResponse)
 async def update_feedback(
     feedback_id: str,
     feedback_update: FeedbackUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user)
 ):
-    db_feedback = await FeedbackDB.get_feedback_by_id(feedback_id)
-    
-    if not db_feedback:
-        raise HTTPException(status_code=404, detail="Feedback not found")
-
-    if str(db_feedback.manager_id) != str(current_user.id):
-        raise HTTPException(
-            status_code=403,
-            detail="You can only update your own feedback"
-        )
-
     update_data = {}
     if feedback_update.strengths is not None:
         update_data["strengths"] = feedback_update.strengths
@@ -264,12 +402,44 @@ async def update_feedback(
             )
         update_data["anonymous"] = feedback_update.anonymous
     
-    updated_feedback = await FeedbackDB.update_feedback(feedback_id, update_data)
+    # Ownership and the If-Match version are part of the update filter, so
+    # the write is a single round-trip and cannot overwrite a concurrent edit.
+    update = FeedbackDB.update_feedback(
+        feedback_id, update_data, manager_id=str(current_user.id), version=parse_if_match(if_match)
+    )
+    # The response needs the recipient's name: look them up alongside the
+    # write, taking the current recipient from the authorization index when
+    # the update does not name a new one.
+    receiver_id = feedback_update.employee_id
+    index = get_authz_index()
+    if receiver_id is None and index is not None:
+        owners = index.feedback_owners(feedback_id)
+        receiver_id = owners[1] if owners else None
+    if receiver_id is not None:
+        updated_feedback, _ = await gather_limited(update, UserDB.get_user_by_id(receiver_id))
+    else:
+        updated_feedback = await update
     
     if not updated_feedback:
-        raise HTTPException(status_code=404, detail="Feedback not found")
+        # Only a failed write pays for a read, to report why it failed.
+        db_feedback = await FeedbackDB.get_feedback_by_id(feedback_id)
+        if not db_feedback:
+            raise HTTPException(status_code=404, detail="Feedback not found")
+        if str(db_feedback.manager_id) != str(current_user.id):
+            raise HTTPException(
+                status_code=403,
+                detail="You can only update your own feedback"
+            )
+        raise HTTPException(
+            status_code=409,
+            detail="Feedback was changed by someone else; reload it and try again",
+            headers={"ETag": feedback_etag(db_feedback)}
+        )
     
+    # Answered by the request's identity map when the lookup above guessed
+    # the recipient right; only an index miss costs a round trip here.
     employee = await UserDB.get_user_by_id(str(updated_feedback.employee_id))
+    response.headers["ETag"] = feedback_etag(updated_feedback)
 
     return FeedbackResponse(
         id=str(updated_feedback.id),
@@ -285,89 +455,70 @@ async def update_feedback(
         acknowledgment_comment=updated_feedback.acknowledgment_comment,
         created_at=updated_feedback.created_at,
         updated_at=updated_feedback.updated_at,
+        version=updated_feedback.version,
+        predicted_sentiment=updated_feedback.predicted_sentiment,
+        sentiment_confidence=updated_feedback.sentiment_confidence,
         giver_name="Anonymous" if updated_feedback.anonymous else (current_user.full_name if current_user else ""),  
         receiver_name=employee.full_name if employee else "",  
         giver_role=current_user.role if current_user else UserRole.employee  
     )
 
 @app.get("/api/feedback/received", response_model=List[FeedbackResponse])
-async def get_received_feedback(current_user: User = Depends(get_current_user)):
+async def get_received_feedback(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
     if current_user.role != UserRole.employee:
         raise HTTPException(
             status_code=403,
             detail="Only employees can access received feedback endpoint"
         )
     
-    feedback_list = await FeedbackDB.get_feedback_by_employee(str(current_user.id))
-    
-    result = []
-    for feedback in feedback_list:
-        manager = await UserDB.get_user_by_id(str(feedback.manager_id))
-        employee = await UserDB.get_user_by_id(str(feedback.employee_id))
-        
-        result.append(FeedbackResponse(
-            id=str(feedback.id),
-            giver_id=str(feedback.manager_id),  
-            receiver_id=str(feedback.employee_id),  
-            strengths=feedback.strengths,
-            improvements=feedback.improvements,
-            sentiment=feedback.sentiment,
-            tags=feedback.tags,
-            anonymous=feedback.anonymous,
-            acknowledged=feedback.acknowledged,
-            acknowledged_at=feedback.acknowledged_at,
-            acknowledgment_comment=feedback.acknowledgment_comment,
-            created_at=feedback.created_at,
-            updated_at=feedback.updated_at,
-            giver_name="Anonymous" if feedback.anonymous else (manager.full_name if manager else ""),  
-            receiver_name=employee.full_name if employee else "",  
-            giver_role=manager.role if manager else UserRole.employee  
-        ))
+    feedback_list = await FeedbackDB.get_feedback_by_employee(str(current_user.id), since, until)
     
-    return result
+    return await build_feedback_responses(feedback_list)
 
 @app.get("/api/feedback/given", response_model=List[FeedbackResponse])
-async def get_given_feedback(current_user: User = Depends(get_current_user)):
+async def get_given_feedback(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
     if current_user.role != UserRole.employee:
         raise HTTPException(
             status_code=403,
             detail="Only employees can access given feedback endpoint"
         )
     
-    feedback_list = await FeedbackDB.get_feedback_by_manager(str(current_user.id))
+    feedback_list = await FeedbackDB.get_feedback_by_manager(str(current_user.id), since, until)
     
-    result = []
-    for feedback in feedback_list:
-        manager = await UserDB.get_user_by_id(str(feedback.manager_id))
-        employee = await UserDB.get_user_by_id(str(feedback.employee_id))
-        
-        result.append(FeedbackResponse(
-            id=str(feedback.id),
-            giver_id=str(feedback.manager_id),  
-            receiver_id=str(feedback.employee_id),  
-            strengths=feedback.strengths,
-            improvements=feedback.improvements,
-            sentiment=feedback.sentiment,
-            tags=feedback.tags,
-            anonymous=feedback.anonymous,
-            acknowledged=feedback.acknowledged,
-            acknowledged_at=feedback.acknowledged_at,
-            acknowledgment_comment=feedback.acknowledgment_comment,
-            created_at=feedback.created_at,
-            updated_at=feedback.updated_at,
-            giver_name="Anonymous" if feedback.anonymous else (manager.full_name if manager else ""),  
-            receiver_name=employee.full_name if employee else "",  
-            giver_role=manager.role if manager else UserRole.employee  
-        ))
-    
-    return result
+    return await build_feedback_responses(feedback_list)
 
 @app.patch("/api/feedback/{feedback_id}/acknowledge")
 async def acknowledge_feedback(
     feedback_id: str,
     acknowledge_data: FeedbackAcknowledge,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
+    return await run_idempotent(
+        idempotency_key,
+        str(current_user.id),
+        f"acknowledge_feedback:{feedback_id}",
+        acknowledge_data.dict(),
+        lambda: _acknowledge_feedback(feedback_id, acknowledge_data, current_user)
+    )
+
+async def _acknowledge_feedback(feedback_id: str, acknowledge_data: FeedbackAcknowledge, current_user: User) -> dict:
+    index = get_authz_index()
+    if index is not None and current_user.role == UserRole.employee:
+        owners = index.feedback_owners(feedback_id)
+        if owners is not None and owners[1] == str(current_user.id):
+            if await FeedbackDB.acknowledge_feedback(feedback_id, str(current_user.id), acknowledge_data.comment):
+                return {"message": "Feedback acknowledged successfully"}
+            # Already acknowledged, gone or no longer theirs; the read below tells which.
+
     db_feedback = await FeedbackDB.get_feedback_by_id(feedback_id)
     
     if not db_feedback:
@@ -380,10 +531,10 @@ async def acknowledge_feedback(
             detail="You can only acknowledge your own feedback"
         )
     
-    success = await FeedbackDB.acknowledge_feedback(feedback_id, acknowledge_data.comment)
-    
-    if not success:
-        raise HTTPException(status_code=404, detail="Feedback not found")
+    # Repeat acknowledgements are no-op reads; a lost race against a
+    # concurrent acknowledgement is equally fine since the feedback exists.
+    if not db_feedback.acknowledged:
+        await FeedbackDB.acknowledge_feedback(feedback_id, str(current_user.id), acknowledge_data.comment)
     
     return {"message": "Feedback acknowledged successfully"}
 
@@ -488,43 +639,81 @@ async def update_manager(
         manager_id=str(updated_user.manager_id) if updated_user.manager_id else None
     )
 
-@app.get("/api/stats")
-async def get_stats(current_user: User = Depends(get_current_user)):
+async def get_stats_for(current_user: User) -> dict:
     if current_user.role == UserRole.manager:
-        feedback_list = await FeedbackDB.get_feedback_by_manager(str(current_user.id))
-        
-        total = len(feedback_list)
-        positive = len([f for f in feedback_list if f.sentiment == SentimentType.positive])
-        neutral = len([f for f in feedback_list if f.sentiment == SentimentType.neutral])
-        constructive = len([f for f in feedback_list if f.sentiment == SentimentType.constructive])
-        acknowledged = len([f for f in feedback_list if f.acknowledged])
+        counts = await FeedbackDB.get_feedback_counts("manager_id", str(current_user.id))
         
         return {
-            "total": total,
-            "positive": positive,
-            "neutral": neutral,
-            "constructive": constructive,
-            "acknowledged": acknowledged
+            "total": counts["total"],
+            "positive": counts["positive"],
+            "neutral": counts["neutral"],
+            "constructive": counts["constructive"],
+            "acknowledged": counts["acknowledged"]
         }
     else:
-        feedback_list = await FeedbackDB.get_feedback_by_employee(str(current_user.id))
-        
-        total = len(feedback_list)
-        acknowledged = len([f for f in feedback_list if f.acknowledged])
-        positive = len([f for f in feedback_list if f.sentiment == SentimentType.positive])
-        pending = total - acknowledged
+        counts = await FeedbackDB.get_feedback_counts("employee_id", str(current_user.id))
         
         return {
-            "total": total,
-            "acknowledged": acknowledged,
-            "positive": positive,
-            "pending": pending
+            "total": counts["total"],
+            "acknowledged": counts["acknowledged"],
+            "positive": counts["positive"],
+            "pending": counts["total"] - counts["acknowledged"]
         }
+
+@app.get("/api/stats")
+async def get_stats(current_user: User = Depends(get_current_user)):
+    return await get_stats_for(current_user)
+
+@app.get("/api/dashboard", response_model=DashboardResponse)
+async def get_dashboard(
+    limit: int = Query(10, ge=1, le=100),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Everything a dashboard page needs in one round-trip
+    """
+    async def recent_feedback():
+        if current_user.role == UserRole.manager:
+            feedback_list = await FeedbackDB.get_feedback_by_manager(str(current_user.id), limit=limit)
+        else:
+            feedback_list = await FeedbackDB.get_feedback_by_employee(str(current_user.id), limit=limit)
+        return await build_feedback_responses(feedback_list)
+
+    # Composite steps use plain gather; the queries inside them take the
+    # per-request concurrency permits, and all of them share the request's
+    # user identity map.
+    team_members, stats, feedback = await asyncio.gather(
+        get_team_for(current_user),
+        get_stats_for(current_user),
+        recent_feedback()
+    )
+    
+    return DashboardResponse(
+        user=UserResponse(
+            id=str(current_user.id),
+            email=current_user.email,
+            full_name=current_user.full_name,
+            role=current_user.role,
+            manager_id=str(current_user.manager_id) if current_user.manager_id else None
+        ),
+        team=[
+            UserResponse(
+                id=str(member.id),
+                email=member.email,
+                full_name=member.full_name,
+                role=member.role,
+                manager_id=str(member.manager_id) if member.manager_id else None
+            )
+            for member in team_members
+        ],
+        stats=stats,
+        recent_feedback=feedback
+    )
     
 @app.post("/api/request-feedback")
 async def request_feedback_from_manager(current_user: User = Depends(get_current_user)):
     """
-    Send feedback request email to manager
+    Queue a feedback request for the manager's next digest email
     """
     if current_user.role != UserRole.employee:
         raise HTTPException(
@@ -546,28 +735,116 @@ async def request_feedback_from_manager(current_user: User = Depends(get_current
             detail="Manager not found"
         )
     
-    # Import email utility
-    from email_utils import send_feedback_request_email
-    
-    # Send email
-    email_sent = send_feedback_request_email(
-        manager_email=manager.email,
-        employee_name=current_user.full_name,
-        manager_name=manager.full_name
-    )
-    
-    if not email_sent:
-        raise HTTPException(
-            status_code=500,
-            detail="Failed to send email. Please try again later."
-        )
+    _, created = await FeedbackRequestDB.record_request(str(current_user.id), str(manager.id))
     
     return {
-        "message": f"Feedback request sent to {manager.full_name} successfully!",
+        "message": f"Feedback request sent to {manager.full_name}! They will be notified in their next digest.",
         "manager_name": manager.full_name,
-        "manager_email": manager.email
+        "manager_email": manager.email,
+        "already_requested": not created
     }
 
+@app.get("/api/feedback-requests", response_model=List[FeedbackRequestResponse])
+async def get_feedback_requests(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.manager:
+        raise HTTPException(
+            status_code=403,
+            detail="Only managers can view feedback requests"
+        )
+    
+    requests = await FeedbackRequestDB.get_open_requests_for_manager(str(current_user.id))
+    employees = await UserDB.get_users_by_ids(str(request.employee_id) for request in requests)
+    
+    return [
+        FeedbackRequestResponse(
+            id=str(request.id),
+            employee_id=str(request.employee_id),
+            employee_name=employees[str(request.employee_id)].full_name if employees.get(str(request.employee_id)) else "",
+            status=request.status,
+            request_count=request.request_count,
+            requested_at=request.requested_at,
+            last_requested_at=request.last_requested_at,
+            sent_at=request.sent_at
+        )
+        for request in requests
+    ]
+
+@app.post("/api/admin/organizations", response_model=OrganizationResponse)
+async def create_organization(organization: OrganizationCreate, current_user: User = Depends(get_admin_user)):
+    try:
+        created, invite_code = await OrganizationDB.create_organization(organization.org_id, organization.name)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Organization already exists")
+    return OrganizationResponse(
+        org_id=created["_id"],
+        name=created["name"],
+        invite_code=invite_code,
+        created_at=created["created_at"]
+    )
+
+@app.get("/api/admin/metrics/reads")
+async def get_read_metrics(current_user: User = Depends(get_admin_user)):
+    return read_metrics.snapshot()
+
+@app.get("/api/admin/metrics/authz")
+async def get_authz_metrics(current_user: User = Depends(get_admin_user)):
+    index = get_authz_index()
+    if index is None:
+        return {"enabled": False}
+    return {"enabled": True, **index.stats()}
+
+@app.get("/api/admin/profiles")
+async def get_profiles(current_user: User = Depends(get_admin_user)):
+    return await profile_store.list()
+
+@app.get("/api/admin/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str, current_user: User = Depends(get_admin_user)):
+    """Collapsed stacks in microseconds, ready for flamegraph.pl or speedscope.
+
+    ``X-Profile-Scope: loop`` marks cProfile profiles, which also contain
+    other requests that ran concurrently.
+    """
+    profile = await profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Profile not found"
+        )
+    return PlainTextResponse("\n".join(profile["stacks"]) + "\n", headers={"X-Profile-Scope": profile["scope"]})
+
+def job_response(job: Job) -> JobResponse:
+    return JobResponse(id=str(job.id), **job.dict(exclude={"id", "checkpoint"}))
+
+@app.post("/api/admin/jobs", response_model=JobResponse)
+async def create_job(job: JobCreate, current_user: User = Depends(get_admin_user)):
+    try:
+        created = await enqueue_job(get_database(), job.type, job.params, created_by=str(current_user.id))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    return job_response(created)
+
+@app.get("/api/admin/jobs", response_model=List[JobResponse])
+async def get_jobs(
+    job_status: Optional[JobStatus] = Query(None, alias="status"),
+    job_type: Optional[str] = Query(None, alias="type"),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_admin_user)
+):
+    return [job_response(job) for job in await list_jobs(get_database(), job_status, job_type, limit)]
+
+@app.get("/api/admin/jobs/{job_id}", response_model=JobResponse)
+async def get_job_by_id(job_id: str, current_user: User = Depends(get_admin_user)):
+    job = await get_job(get_database(), job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Job not found"
+        )
+    return job_response(job)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
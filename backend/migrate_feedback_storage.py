@@ -0,0 +1,108 @@
+"""Convert feedback documents between storage layouts and report their footprint.
+
+    python migrate_feedback_storage.py report
+    python migrate_feedback_storage.py migrate [--batch-size 500]
+    python migrate_feedback_storage.py rollback [--batch-size 500]
+
+``migrate`` rewrites legacy documents in the compact layout (``_v: 2``) and
+``rollback`` does the reverse. Both cover ``feedback`` and ``feedback_archive``,
+are safe to interrupt and re-run, and skip documents edited mid-batch. Set
+FEEDBACK_STORAGE_FORMAT to match before migrating so new writes agree.
+"""
+import argparse
+import asyncio
+
+from pymongo import ReplaceOne
+
+from database import connect_to_mongo, close_mongo_connection, get_database
+from models import FeedbackCodec, FEEDBACK_FORMAT_LEGACY, FEEDBACK_FORMAT_COMPACT
+
+COLLECTIONS = ["feedback", "feedback_archive"]
+
+
+async def convert(db, collection_name: str, target_format: int, batch_size: int, start_after=None, on_batch=None) -> int:
+    """Convert documents after ``start_after`` in ``_id`` order.
+
+    ``on_batch(last_id, converted)`` is awaited after every batch so callers
+    can checkpoint and later resume with ``start_after=last_id``.
+    """
+    collection = db[collection_name]
+    source_format = FEEDBACK_FORMAT_LEGACY if target_format == FEEDBACK_FORMAT_COMPACT else FEEDBACK_FORMAT_COMPACT
+    converted = 0
+    last_id = start_after
+
+    while True:
+        query = FeedbackCodec.layout_filter(source_format)
+        if last_id is not None:
+            query = {**query, "_id": {"$gt": last_id}}
+        batch = await collection.find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        decoded = await FeedbackCodec.decode_many(batch)
+        requests = []
+        for document, feedback_data in zip(batch, decoded):
+            # Only replace the document if nobody touched it since we read it.
+            # org_id completes the shard key of the sharded collections.
+            guard = {"org_id": document.get("org_id"), "_id": document["_id"], **FeedbackCodec.layout_filter(source_format)}
+            if source_format == FEEDBACK_FORMAT_LEGACY:
+                guard["updated_at"] = document.get("updated_at")
+            else:
+                guard["u"] = document.get("u")
+            requests.append(ReplaceOne(guard, await FeedbackCodec.encode(feedback_data, target_format)))
+
+        result = await collection.bulk_write(requests, ordered=False)
+        converted += result.modified_count
+        print(f"{collection_name}: converted {converted} documents")
+        if on_batch is not None:
+            await on_batch(last_id, converted)
+
+    return converted
+
+
+async def report(db):
+    print(f"{'collection':<18}{'layout':>8}{'docs':>10}{'avg bytes':>12}{'total bytes':>14}")
+    for collection_name in COLLECTIONS:
+        rows = await db[collection_name].aggregate([
+            {"$group": {
+                "_id": {"$ifNull": ["$_v", FEEDBACK_FORMAT_LEGACY]},
+                "count": {"$sum": 1},
+                "avg_size": {"$avg": {"$bsonSize": "$$ROOT"}},
+                "total_size": {"$sum": {"$bsonSize": "$$ROOT"}}
+            }},
+            {"$sort": {"_id": 1}}
+        ]).to_list(None)
+        for row in rows:
+            print(f"{collection_name:<18}{row['_id']:>8}{row['count']:>10}{row['avg_size']:>12.0f}{row['total_size']:>14}")
+
+    print()
+    print(f"{'collection':<18}{'data size':>14}{'storage size':>14}{'index size':>14}")
+    for collection_name in COLLECTIONS + ["tags"]:
+        stats = await db.command("collStats", collection_name)
+        print(f"{collection_name:<18}{stats.get('size', 0):>14}{stats.get('storageSize', 0):>14}{stats.get('totalIndexSize', 0):>14}")
+        for index_name, size in sorted(stats.get("indexSizes", {}).items()):
+            print(f"  {index_name:<30}{size:>14}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["migrate", "rollback", "report"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    await connect_to_mongo(start_services=False)
+    try:
+        db = get_database()
+        if args.command == "report":
+            await report(db)
+            return
+        target_format = FEEDBACK_FORMAT_COMPACT if args.command == "migrate" else FEEDBACK_FORMAT_LEGACY
+        for collection_name in COLLECTIONS:
+            await convert(db, collection_name, target_format, args.batch_size)
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""Move single-tenant data into an organization and prepare collections for sharding.
+
+    python migrate_tenancy.py backfill [--org-id default]
+    python migrate_tenancy.py shard
+
+``backfill`` stamps every user, feedback, archived feedback and feedback
+request without an ``org_id`` with the given organization, then drops the
+owner indexes that predate the organization prefix. It is safe to re-run.
+
+``shard`` must run against a mongos. It shards the feedback collections on
+``{org_id: 1, _id: "hashed"}``: the ``org_id`` prefix keeps per-tenant queries
+targeted, and hashing ``_id`` (which also encodes creation time) spreads one
+large tenant's inserts across its chunks instead of piling them onto the last
+one. ``employee_id`` is left out of the key because the compact storage layout
+stores it under a different name. ``users`` and ``feedback_requests`` stay
+unsharded: they are small, and their unique indexes (``email``, one pending
+request per pair) could not be kept on a sharded collection.
+"""
+import argparse
+import asyncio
+
+from pymongo.errors import OperationFailure
+
+from database import DATABASE_NAME, connect_to_mongo, close_mongo_connection, get_database
+from models import DEFAULT_ORG_ID
+
+TENANT_COLLECTIONS = ["users", "feedback", "feedback_archive", "feedback_requests"]
+SHARDED_COLLECTIONS = ["feedback", "feedback_archive"]
+SHARD_KEY = {"org_id": 1, "_id": "hashed"}
+
+# Indexes created before owner lookups were prefixed with org_id.
+OBSOLETE_INDEXES = {
+    "feedback": ["manager_id_1_employee_id_1", "m_1__id_-1", "e_1__id_-1"],
+    "feedback_archive": ["manager_id_1_employee_id_1", "employee_id_1", "m_1__id_-1", "e_1__id_-1"],
+    "feedback_requests": ["manager_id_1_fulfilled_at_1_requested_at_-1", "employee_id_1_manager_id_1_requested_at_-1"],
+}
+
+
+async def backfill(db, org_id: str):
+    for collection_name in TENANT_COLLECTIONS:
+        result = await db[collection_name].update_many(
+            {"org_id": {"$exists": False}},
+            {"$set": {"org_id": org_id}}
+        )
+        print(f"{collection_name}: assigned {result.modified_count} documents to {org_id}")
+
+    for collection_name, index_names in OBSOLETE_INDEXES.items():
+        existing = await db[collection_name].index_information()
+        for index_name in index_names:
+            if index_name in existing:
+                await db[collection_name].drop_index(index_name)
+                print(f"{collection_name}: dropped index {index_name}")
+
+
+async def shard(db):
+    admin = db.client.admin
+    try:
+        await admin.command("enableSharding", DATABASE_NAME)
+    except OperationFailure as e:
+        # Already enabled, or a server version where this is implicit.
+        print(f"enableSharding: {e}")
+
+    for collection_name in SHARDED_COLLECTIONS:
+        await db[collection_name].create_index(list(SHARD_KEY.items()))
+        await admin.command("shardCollection", f"{DATABASE_NAME}.{collection_name}", key=SHARD_KEY)
+        print(f"{collection_name}: sharded on {SHARD_KEY}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["backfill", "shard"])
+    parser.add_argument("--org-id", default=DEFAULT_ORG_ID)
+    args = parser.parse_args()
+
+    await connect_to_mongo(start_services=False)
+    try:
+        db = get_database()
+        if args.command == "backfill":
+            await backfill(db, args.org_id)
+        else:
+            await shard(db)
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
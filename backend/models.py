@@ -1,10 +1,26 @@
-from datetime import datetime
-from typing import Optional, List
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Iterable, Tuple
 from pydantic import BaseModel, Field
 from pydantic_core import core_schema
 from typing import Any
-from bson import ObjectId
+from bson import ObjectId, Timestamp
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import contextvars
 import enum
+import hashlib
+import os
+import secrets
+
+from archive import range_needs_archive
+from read_routing import ReadRoute, recent_writers
+
+REQUEST_CONCURRENCY_LIMIT = int(os.getenv("REQUEST_CONCURRENCY_LIMIT", "8"))
+FEEDBACK_REQUEST_DEDUP_HOURS = int(os.getenv("FEEDBACK_REQUEST_DEDUP_HOURS", "24"))
+# Organization that pre-tenancy data and tokens without an "org" claim belong to.
+DEFAULT_ORG_ID = os.getenv("DEFAULT_ORG_ID", "default")
 
 class PyObjectId(ObjectId):
     @classmethod
@@ -37,6 +53,7 @@ class User(BaseModel):
     email: str
     full_name: str
     role: UserRole
+    org_id: str = DEFAULT_ORG_ID
     manager_id: Optional[PyObjectId] = None
     hashed_password: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -49,6 +66,7 @@ class User(BaseModel):
 
 class Feedback(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    org_id: str = DEFAULT_ORG_ID
     manager_id: PyObjectId
     employee_id: PyObjectId
     strengths: str
@@ -61,6 +79,12 @@ class Feedback(BaseModel):
     acknowledgment_comment: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Incremented by every write. Documents written before versioning have no
+    # field and read as 0.
+    version: int = 0
+    # Filled in asynchronously by the sentiment classifier (sentiment.py).
+    predicted_sentiment: Optional[SentimentType] = None
+    sentiment_confidence: Optional[float] = None
 
     class Config:
         allow_population_by_field_name = True
@@ -68,16 +92,397 @@ class Feedback(BaseModel):
         json_encoders = {ObjectId: str}
 
 
+FEEDBACK_FORMAT_LEGACY = 1
+FEEDBACK_FORMAT_COMPACT = 2
+# Layout new feedback documents are written in. Reads understand both, so this
+# can be flipped before migrate_feedback_storage.py has converted old documents.
+FEEDBACK_STORAGE_FORMAT = int(os.getenv("FEEDBACK_STORAGE_FORMAT", str(FEEDBACK_FORMAT_LEGACY)))
+
+# Public field name -> compact storage key. ``created_at`` has no key: it is
+# the ``_id`` timestamp, stored as "c" only when a migrated document's value
+# differs from it. ``org_id`` keeps its name in both layouts because it is
+# part of the shard key.
+COMPACT_FEEDBACK_FIELDS = {
+    "manager_id": "m",
+    "employee_id": "e",
+    "strengths": "s",
+    "improvements": "i",
+    "sentiment": "sn",
+    "tags": "t",
+    "anonymous": "an",
+    "acknowledged": "ak",
+    "acknowledged_at": "aa",
+    "acknowledgment_comment": "ac",
+    "updated_at": "u",
+    "version": "v",
+    "predicted_sentiment": "ps",
+    "sentiment_confidence": "pc",
+}
+SENTIMENT_FIELDS = ("sentiment", "predicted_sentiment")
+PUBLIC_FEEDBACK_FIELDS = {key: field for field, key in COMPACT_FEEDBACK_FIELDS.items()}
+
+SENTIMENT_CODES = {
+    SentimentType.neutral: 0,
+    SentimentType.positive: 1,
+    SentimentType.constructive: 2,
+}
+SENTIMENTS_BY_CODE = {code: sentiment for sentiment, code in SENTIMENT_CODES.items()}
+
+
+def object_id_time(object_id: ObjectId) -> datetime:
+    return object_id.generation_time.replace(tzinfo=None)
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """``value`` as the naive UTC datetime stored timestamps use.
+
+    Query parameters with an offset (``2024-01-01T00:00:00Z``) parse as aware
+    datetimes, which cannot be compared with naive ones.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class TagDictionary:
+    """Interns tag strings as small integer ids stored in the ``tags`` collection.
+
+    Tags are never renamed or removed, so the in-process maps never go stale.
+    """
+
+    _ids: Dict[str, int] = {}
+    _names: Dict[int, str] = {}
+
+    @classmethod
+    def _remember(cls, tag_id: int, name: str):
+        cls._ids[name] = tag_id
+        cls._names[tag_id] = name
+
+    @classmethod
+    async def intern(cls, names: List[str]) -> List[int]:
+        from database import get_database
+        db = get_database()
+
+        missing = [name for name in dict.fromkeys(names) if name not in cls._ids]
+        if missing:
+            async for tag in db.tags.find({"name": {"$in": missing}}):
+                cls._remember(tag["_id"], tag["name"])
+        for name in missing:
+            if name in cls._ids:
+                continue
+            counter = await db.counters.find_one_and_update(
+                {"_id": "tags"},
+                {"$inc": {"seq": 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            try:
+                await db.tags.insert_one({"_id": counter["seq"], "name": name})
+                cls._remember(counter["seq"], name)
+            except DuplicateKeyError:
+                # Interned concurrently by another worker; the spare id is simply unused.
+                tag = await db.tags.find_one({"name": name})
+                cls._remember(tag["_id"], tag["name"])
+        return [cls._ids[name] for name in names]
+
+    @classmethod
+    async def resolve(cls, tag_ids: Iterable[int]):
+        """Make sure every id in ``tag_ids`` is in the in-process map."""
+        from database import get_database
+        db = get_database()
+
+        missing = list({tag_id for tag_id in tag_ids if tag_id not in cls._names})
+        if missing:
+            async for tag in db.tags.find({"_id": {"$in": missing}}):
+                cls._remember(tag["_id"], tag["name"])
+
+    @classmethod
+    def name(cls, tag_id: int) -> str:
+        return cls._names.get(tag_id, str(tag_id))
+
+
+class FeedbackCodec:
+    """Maps between the public ``Feedback`` shape and its stored layouts.
+
+    Legacy documents use the public field names verbatim. Compact documents
+    carry ``_v: 2``, short keys, small-int sentiment codes and interned tag
+    ids, and take ``created_at`` from the ``_id`` timestamp.
+    """
+
+    @staticmethod
+    def storage_format(doc: dict) -> int:
+        return doc.get("_v", FEEDBACK_FORMAT_LEGACY)
+
+    @staticmethod
+    def formats() -> List[int]:
+        """Both layouts, the configured write format first."""
+        if FEEDBACK_STORAGE_FORMAT == FEEDBACK_FORMAT_COMPACT:
+            return [FEEDBACK_FORMAT_COMPACT, FEEDBACK_FORMAT_LEGACY]
+        return [FEEDBACK_FORMAT_LEGACY, FEEDBACK_FORMAT_COMPACT]
+
+    @staticmethod
+    def layout_filter(storage_format: int) -> dict:
+        if storage_format == FEEDBACK_FORMAT_COMPACT:
+            return {"_v": FEEDBACK_FORMAT_COMPACT}
+        return {"_v": {"$exists": False}}
+
+    @staticmethod
+    def match(field: str, value: Any) -> dict:
+        """Filter matching ``field == value`` in documents of either layout."""
+        compact_value = value
+        if field == "sentiment":
+            compact_value = SENTIMENT_CODES[SentimentType(value)]
+        return {"$or": [{field: value}, {COMPACT_FEEDBACK_FIELDS[field]: compact_value}]}
+
+    @staticmethod
+    async def encode_fields(data: dict, storage_format: Optional[int] = None) -> dict:
+        """Encode a partial set of public fields, e.g. for ``$set``."""
+        storage_format = storage_format or FEEDBACK_STORAGE_FORMAT
+        if storage_format != FEEDBACK_FORMAT_COMPACT:
+            return dict(data)
+
+        encoded = {}
+        for field, value in data.items():
+            if field in SENTIMENT_FIELDS and value is not None:
+                value = SENTIMENT_CODES[SentimentType(value)]
+            elif field == "tags" and value is not None:
+                value = await TagDictionary.intern(list(value))
+            encoded[COMPACT_FEEDBACK_FIELDS.get(field, field)] = value
+        return encoded
+
+    @staticmethod
+    async def encode(feedback_data: dict, storage_format: Optional[int] = None) -> dict:
+        """Encode a complete feedback document, including ``_id``."""
+        storage_format = storage_format or FEEDBACK_STORAGE_FORMAT
+        if storage_format != FEEDBACK_FORMAT_COMPACT:
+            return dict(feedback_data)
+
+        feedback_data = dict(feedback_data)
+        feedback_id = feedback_data.pop("_id")
+        created_at = feedback_data.pop("created_at", None)
+        document = {"_id": feedback_id, "_v": FEEDBACK_FORMAT_COMPACT}
+        document.update(await FeedbackCodec.encode_fields(feedback_data, storage_format))
+        if created_at is not None and abs((created_at - object_id_time(feedback_id)).total_seconds()) >= 1:
+            document["c"] = created_at
+        return document
+
+    @staticmethod
+    def _decode_compact(document: dict) -> dict:
+        feedback_data = {"_id": document["_id"]}
+        for key, value in document.items():
+            field = PUBLIC_FEEDBACK_FIELDS.get(key)
+            if field is None:
+                if key not in ("_id", "_v", "c"):
+                    feedback_data[key] = value
+                continue
+            if field in SENTIMENT_FIELDS and value is not None:
+                value = SENTIMENTS_BY_CODE[value]
+            elif field == "tags":
+                value = [TagDictionary.name(tag_id) for tag_id in value or []]
+            feedback_data[field] = value
+        feedback_data["created_at"] = document.get("c") or object_id_time(document["_id"])
+        return feedback_data
+
+    @staticmethod
+    async def decode_many(documents: List[dict]) -> List[dict]:
+        """Decode stored documents of either layout into public field dicts."""
+        tag_ids = [
+            tag_id
+            for document in documents
+            if FeedbackCodec.storage_format(document) == FEEDBACK_FORMAT_COMPACT
+            for tag_id in document.get("t") or []
+        ]
+        if tag_ids:
+            await TagDictionary.resolve(tag_ids)
+        return [
+            FeedbackCodec._decode_compact(document)
+            if FeedbackCodec.storage_format(document) == FEEDBACK_FORMAT_COMPACT
+            else document
+            for document in documents
+        ]
+
+    @staticmethod
+    async def decode(document: dict) -> dict:
+        return (await FeedbackCodec.decode_many([document]))[0]
+
+
+class FeedbackRequestStatus(str, enum.Enum):
+    pending = "pending"
+    sending = "sending"
+    sent = "sent"
+
+class FeedbackRequest(BaseModel):
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    org_id: str = DEFAULT_ORG_ID
+    employee_id: PyObjectId
+    manager_id: PyObjectId
+    status: FeedbackRequestStatus = FeedbackRequestStatus.pending
+    request_count: int = 1
+    requested_at: datetime = Field(default_factory=datetime.utcnow)
+    last_requested_at: datetime = Field(default_factory=datetime.utcnow)
+    sent_at: Optional[datetime] = None
+    fulfilled_at: Optional[datetime] = None
+
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+
+class RequestScope:
+    """Per-request state shared by the data-access layer.
+
+    Holds an identity map of users (so the same user is fetched at most once
+    per request, including the lookup done by ``get_current_user``), a
+    semaphore capping how many queries one request may run concurrently, the
+    organization every query of the request is restricted to once the caller
+    is authenticated, and the causal-consistency state used to route reads.
+    """
+
+    def __init__(self, concurrency_limit: int = REQUEST_CONCURRENCY_LIMIT):
+        self.users: Dict[str, asyncio.Future] = {}
+        self.semaphore = asyncio.Semaphore(concurrency_limit)
+        self.org_id: Optional[str] = None
+        self.user_id: Optional[str] = None
+        # Operation time the client has already observed (X-Causal-Token);
+        # secondary reads of this request must not return anything older.
+        self.causal_token: Optional[Timestamp] = None
+        # Operation time of the latest write made by this request.
+        self.operation_time: Optional[Timestamp] = None
+        self.wrote = False
+        self.sessions = []
+
+    async def causal_session(self):
+        """A new causally consistent session that has seen the client's token.
+
+        Sessions are not safe for concurrent use, so every operation that may
+        run alongside others gets its own.
+        """
+        from database import start_causal_session
+        session = await start_causal_session()
+        if session is not None:
+            if self.causal_token is not None:
+                session.advance_operation_time(self.causal_token)
+            self.sessions.append(session)
+        return session
+
+    def record_write(self, session):
+        self.wrote = True
+        if self.user_id is not None:
+            recent_writers.mark(self.user_id)
+        if session is not None and session.operation_time is not None:
+            if self.operation_time is None or session.operation_time > self.operation_time:
+                self.operation_time = session.operation_time
+
+    async def close(self):
+        for session in self.sessions:
+            await session.end_session()
+        self.sessions.clear()
+
+    def remember_user(self, user: Optional["User"], user_id: Optional[str] = None):
+        key = user_id or str(user.id)
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(user)
+        self.users[key] = future
+
+    def forget_user(self, user_id: str):
+        self.users.pop(user_id, None)
+
+    async def limited(self, awaitable):
+        async with self.semaphore:
+            return await awaitable
+
+
+_request_scope: contextvars.ContextVar[Optional[RequestScope]] = contextvars.ContextVar("request_scope", default=None)
+
+def begin_request_scope() -> contextvars.Token:
+    return _request_scope.set(RequestScope())
+
+def end_request_scope(token: contextvars.Token):
+    _request_scope.reset(token)
+
+def get_request_scope() -> Optional[RequestScope]:
+    return _request_scope.get()
+
+def tenant_filter() -> dict:
+    """Restrict a query to the current request's organization.
+
+    Empty outside an authenticated request, e.g. for login and for
+    maintenance tasks that deliberately span tenants.
+    """
+    scope = get_request_scope()
+    if scope is not None and scope.org_id is not None:
+        return {"org_id": scope.org_id}
+    return {}
+
+async def routed_read(name: str):
+    """Collection and session for a list or stats read on ``name``.
+
+    These reads tolerate bounded staleness and go to a secondary, except
+    right after the caller wrote: then they stay on the primary so the caller
+    sees their own change. A causal token from the client makes secondary
+    reads wait until the member has caught up to it.
+    """
+    from database import get_collection
+    scope = get_request_scope()
+    if scope is None:
+        return get_collection(name, ReadRoute.secondary), None
+    if scope.wrote or (scope.user_id is not None and recent_writers.is_recent(scope.user_id)):
+        return get_collection(name, ReadRoute.primary), None
+    session = await scope.causal_session() if scope.causal_token is not None else None
+    return get_collection(name, ReadRoute.secondary), session
+
+async def write_session():
+    """Session for a write whose operation time is reported back to the client."""
+    scope = get_request_scope()
+    if scope is None:
+        return None
+    return await scope.causal_session()
+
+def record_write(session):
+    scope = get_request_scope()
+    if scope is not None:
+        scope.record_write(session)
+
+def index_user(user: Optional["User"]):
+    """Keep the authorization index in step with a user this process wrote or read."""
+    from database import get_authz_index
+    authz_index = get_authz_index()
+    if authz_index is not None and user is not None:
+        authz_index.remember_user(user.id, user.org_id, user.manager_id)
+
+def index_feedback(feedback_data: dict):
+    """Same as ``index_user`` for decoded feedback."""
+    from database import get_authz_index
+    authz_index = get_authz_index()
+    if authz_index is not None:
+        authz_index.remember_feedback(feedback_data["_id"], feedback_data.get("manager_id"), feedback_data.get("employee_id"))
+
+async def gather_limited(*awaitables):
+    """``asyncio.gather`` bounded by the current request's concurrency cap.
+
+    Only wrap leaf queries: an awaitable that itself calls ``gather_limited``
+    could wait on a permit held by its own parent.
+    """
+    scope = get_request_scope()
+    if scope is None:
+        return await asyncio.gather(*awaitables)
+    return await asyncio.gather(*(scope.limited(aw) for aw in awaitables))
+
+
 class UserDB:
     @staticmethod
     async def create_user(user_data: dict) -> User:
         from database import get_database
         db = get_database()
+        user_data.setdefault("org_id", DEFAULT_ORG_ID)
         user_data["created_at"] = datetime.utcnow()
         user_data["updated_at"] = datetime.utcnow()
         result = await db.users.insert_one(user_data)
         user_data["_id"] = result.inserted_id
-        return User(**user_data)
+        user = User(**user_data)
+        index_user(user)
+        return user
 
     @staticmethod
     async def get_user_by_email(email: str) -> Optional[User]:
@@ -88,23 +493,34 @@ class UserDB:
             return User(**user_data)
         return None
 
-    
     @staticmethod
     async def get_user_by_id(user_id: str) -> Optional[User]:
-        from database import get_database
-        db = get_database()
+        scope = get_request_scope()
+        if scope is None:
+            return await UserDB._fetch_user_by_id(user_id)
+
+        pending = scope.users.get(user_id)
+        if pending is None:
+            pending = asyncio.ensure_future(UserDB._fetch_user_by_id(user_id))
+            scope.users[user_id] = pending
+        return await pending
+
+    @staticmethod
+    async def _fetch_user_by_id(user_id: str) -> Optional[User]:
+        from database import get_collection
+        # Backs authentication, so always read from the primary.
+        users = get_collection("users", ReadRoute.primary)
 
-        print(f"get_user_by_id called with user_id: {ObjectId(user_id)}, type: {type(user_id)}")
-        
         if not ObjectId.is_valid(user_id):
             print(f"Invalid ObjectId format: {user_id}")
             return None
         
         try:
-            user_data = await db.users.find_one({"_id": ObjectId(user_id)})
+            user_data = await users.find_one({"_id": ObjectId(user_id), **tenant_filter()})
             if user_data:
-                print(f"User found: {user_data.get('full_name', 'Unknown')}")
-                return User(**user_data)
+                user = User(**user_data)
+                index_user(user)
+                return user
             else:
                 print(f"No user found with id: {user_id}")
                 return None
@@ -115,14 +531,51 @@ class UserDB:
             print(f"Unexpected error for {user_id}: {e}")
             return None
 
+    @staticmethod
+    async def get_users_by_ids(user_ids: Iterable[str]) -> Dict[str, Optional[User]]:
+        """Resolve many users with at most one query, reusing the identity map."""
+        from database import get_database
+        db = get_database()
+        scope = get_request_scope()
+
+        user_ids = set(user_ids)
+        missing = [
+            user_id for user_id in user_ids
+            if ObjectId.is_valid(user_id) and (scope is None or user_id not in scope.users)
+        ]
+
+        fetched: Dict[str, Optional[User]] = {}
+        if missing:
+            cursor = db.users.find({"_id": {"$in": [ObjectId(user_id) for user_id in missing]}, **tenant_filter()})
+            async for user_data in cursor:
+                user = User(**user_data)
+                fetched[str(user.id)] = user
+                index_user(user)
+
+        users: Dict[str, Optional[User]] = {}
+        for user_id in user_ids:
+            if not ObjectId.is_valid(user_id):
+                users[user_id] = None
+            elif user_id in missing:
+                users[user_id] = fetched.get(user_id)
+                if scope is not None:
+                    scope.remember_user(users[user_id], user_id)
+            else:
+                users[user_id] = await scope.users[user_id]
+        return users
+
     @staticmethod
     async def get_team_members(manager_id: str) -> List[User]:
         from database import get_database
         db = get_database()
-        cursor = db.users.find({"manager_id": ObjectId(manager_id)})
+        cursor = db.users.find({**tenant_filter(), "manager_id": ObjectId(manager_id)})
+        scope = get_request_scope()
         team_members = []
         async for user_data in cursor:
-            team_members.append(User(**user_data))
+            user = User(**user_data)
+            team_members.append(user)
+            if scope is not None:
+                scope.remember_user(user)
         return team_members
     
     @staticmethod
@@ -130,83 +583,264 @@ class UserDB:
         from database import get_database
         db = get_database()
         result = await db.users.find_one_and_update(
-            {"_id": ObjectId(user_id)},
+            {"_id": ObjectId(user_id), **tenant_filter()},
             {"$set": update_data},
             return_document=True
         )
+        scope = get_request_scope()
         if result:
-            return User(**result)
+            user = User(**result)
+            index_user(user)
+            if scope is not None:
+                scope.remember_user(user)
+            return user
+        if scope is not None:
+            scope.forget_user(user_id)
         return None
     
+    @staticmethod
+    async def get_manager_in_org(manager_id: str, org_id: str) -> Optional[User]:
+        """The manager with ``manager_id`` in ``org_id``; None for anyone else."""
+        from database import get_collection
+        if not ObjectId.is_valid(manager_id):
+            return None
+        users = get_collection("users", ReadRoute.primary)
+        user_data = await users.find_one({"_id": ObjectId(manager_id), "org_id": org_id, "role": UserRole.manager.value})
+        return User(**user_data) if user_data else None
+
     @staticmethod
     async def get_managers() -> List[User]:
         from database import get_database
         db = get_database()
-        cursor = db.users.find({"role": "manager"})
+        cursor = db.users.find({**tenant_filter(), "role": "manager"})
         managers = []
         async for user_data in cursor:
             managers.append(User(**user_data))
         return managers
 
+def _invite_hash(invite_code: str) -> str:
+    return hashlib.sha256(invite_code.encode()).hexdigest()
+
+
+class OrganizationDB:
+    """Organizations created by admins; users join one with its invite code.
+
+    Only a hash of the invite code is stored, so the code itself is shown
+    once, when the organization is created.
+    """
+
+    @staticmethod
+    async def create_organization(org_id: str, name: str) -> Tuple[dict, str]:
+        """Create an organization; returns it with its invite code.
+
+        Raises DuplicateKeyError when ``org_id`` is taken.
+        """
+        from database import get_database
+        db = get_database()
+        invite_code = secrets.token_urlsafe(24)
+        organization = {
+            "_id": org_id,
+            "name": name,
+            "invite_code_hash": _invite_hash(invite_code),
+            "created_at": datetime.utcnow()
+        }
+        await db.organizations.insert_one(organization)
+        return organization, invite_code
+
+    @staticmethod
+    async def get_organization_by_invite(invite_code: str) -> Optional[dict]:
+        from database import get_database
+        db = get_database()
+        return await db.organizations.find_one({"invite_code_hash": _invite_hash(invite_code)})
+
+
 class FeedbackDB:
     @staticmethod
     async def create_feedback(feedback_data: dict) -> Feedback:
-        from database import get_database
+        from database import get_database, get_sentiment_pipeline
         db = get_database()
-        feedback_data["created_at"] = datetime.utcnow()
+        feedback_data["_id"] = ObjectId()
+        feedback_data.setdefault("org_id", DEFAULT_ORG_ID)
+        if FEEDBACK_STORAGE_FORMAT == FEEDBACK_FORMAT_COMPACT:
+            # Compact documents take created_at from the _id timestamp.
+            feedback_data["created_at"] = object_id_time(feedback_data["_id"])
+        else:
+            feedback_data["created_at"] = datetime.utcnow()
         feedback_data["updated_at"] = datetime.utcnow()
         feedback_data["acknowledged"] = False
-        result = await db.feedback.insert_one(feedback_data)
-        feedback_data["_id"] = result.inserted_id
+        feedback_data["version"] = 1
+        session = await write_session()
+        await db.feedback.insert_one(await FeedbackCodec.encode(feedback_data), session=session)
+        record_write(session)
+        index_feedback(feedback_data)
+        sentiment_pipeline = get_sentiment_pipeline()
+        if sentiment_pipeline is not None:
+            sentiment_pipeline.submit(feedback_data["_id"])
         return Feedback(**feedback_data)
 
     @staticmethod
-    async def get_feedback_by_manager(manager_id: str) -> List[Feedback]:
-        from database import get_database
-        db = get_database()
-        cursor = db.feedback.find({"manager_id": ObjectId(manager_id)}).sort("created_at", -1)
-        feedback_list = []
-        async for feedback_data in cursor:
-            feedback_list.append(Feedback(**feedback_data))
-        return feedback_list
+    async def _find_feedback(query: dict, since: Optional[datetime] = None, until: Optional[datetime] = None, limit: Optional[int] = None) -> List[Feedback]:
+        # created_at ranges are resolved against the _id timestamp, which is
+        # the creation time in both storage layouts.
+        since, until = naive_utc(since), naive_utc(until)
+        query = {**tenant_filter(), **query}
+        id_range = {}
+        if since is not None:
+            id_range["$gte"] = ObjectId.from_datetime(since)
+        if until is not None:
+            id_range["$lt"] = ObjectId.from_datetime(until)
+        if id_range:
+            query["_id"] = id_range
+
+        if limit:
+            # A page is usually filled from the hot collection alone, so only
+            # fall through to the archive for whatever is still missing.
+            feedback, session = await routed_read("feedback")
+            documents = await feedback.find(query, session=session).sort("_id", -1).limit(limit).to_list(limit)
+            if len(documents) < limit and range_needs_archive(since):
+                remaining = limit - len(documents)
+                feedback_archive, session = await routed_read("feedback_archive")
+                documents += await feedback_archive.find(query, session=session).sort("_id", -1).limit(remaining).to_list(remaining)
+                documents.sort(key=lambda feedback_data: feedback_data["_id"], reverse=True)
+            return [Feedback(**feedback_data) for feedback_data in await FeedbackCodec.decode_many(documents)]
+
+        names = ["feedback"]
+        if range_needs_archive(since):
+            names.append("feedback_archive")
+        reads = [await routed_read(name) for name in names]
+
+        batches = await gather_limited(*(
+            collection.find(query, session=session).sort("_id", -1).to_list(None)
+            for collection, session in reads
+        ))
+        documents = [feedback_data for batch in batches for feedback_data in batch]
+        if len(batches) > 1:
+            documents.sort(key=lambda feedback_data: feedback_data["_id"], reverse=True)
+        return [Feedback(**feedback_data) for feedback_data in await FeedbackCodec.decode_many(documents)]
 
     @staticmethod
-    async def get_feedback_by_employee(employee_id: str) -> List[Feedback]:
-        from database import get_database
-        db = get_database()
-        cursor = db.feedback.find({"employee_id": ObjectId(employee_id)}).sort("created_at", -1)
-        feedback_list = []
-        async for feedback_data in cursor:
-            feedback_list.append(Feedback(**feedback_data))
-        return feedback_list
+    async def get_feedback_by_manager(manager_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None, limit: Optional[int] = None) -> List[Feedback]:
+        return await FeedbackDB._find_feedback(FeedbackCodec.match("manager_id", ObjectId(manager_id)), since, until, limit)
 
     @staticmethod
-    async def update_feedback(feedback_id: str, update_data: dict) -> Optional[Feedback]:
+    async def get_feedback_by_employee(employee_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None, limit: Optional[int] = None) -> List[Feedback]:
+        return await FeedbackDB._find_feedback(FeedbackCodec.match("employee_id", ObjectId(employee_id)), since, until, limit)
+
+    @staticmethod
+    async def get_feedback_counts(owner_field: str, owner_id: str) -> Dict[str, int]:
+        """Count feedback by sentiment and acknowledgement without loading it.
+
+        ``owner_field`` is ``manager_id`` or ``employee_id``.
+        """
+        pipeline = [
+            {"$match": {**tenant_filter(), **FeedbackCodec.match(owner_field, ObjectId(owner_id))}},
+            {"$group": {
+                "_id": {
+                    "sentiment": {"$ifNull": ["$sentiment", "$sn"]},
+                    "acknowledged": {"$ifNull": ["$acknowledged", "$ak"]}
+                },
+                "count": {"$sum": 1}
+            }}
+        ]
+        names = ["feedback"]
+        if range_needs_archive(None):
+            names.append("feedback_archive")
+        reads = [await routed_read(name) for name in names]
+        batches = await gather_limited(*(
+            collection.aggregate(pipeline, session=session).to_list(None) for collection, session in reads
+        ))
+
+        counts = {"total": 0, "acknowledged": 0}
+        counts.update({sentiment.value: 0 for sentiment in SentimentType})
+        for group in (group for batch in batches for group in batch):
+            sentiment = group["_id"].get("sentiment")
+            if isinstance(sentiment, int):
+                sentiment = SENTIMENTS_BY_CODE[sentiment]
+            counts["total"] += group["count"]
+            if sentiment is not None:
+                counts[SentimentType(sentiment).value] += group["count"]
+            if group["_id"].get("acknowledged"):
+                counts["acknowledged"] += group["count"]
+        return counts
+
+    @staticmethod
+    async def _update_one(feedback_id: str, conditions: dict, changes: dict) -> Optional[dict]:
+        """Apply public-field ``changes`` to one feedback document matching ``conditions``.
+
+        The document may live in either collection and either storage layout;
+        the configured layout in the hot collection is tried first. Every
+        update bumps ``version``. Returns the updated document, decoded.
+        """
         from database import get_database
         db = get_database()
-        update_data["updated_at"] = datetime.utcnow()
-        result = await db.feedback.find_one_and_update(
-            {"_id": ObjectId(feedback_id)},
-            {"$set": update_data},
-            return_document=True
-        )
-        if result:
-            return Feedback(**result)
+        session = await write_session()
+        for collection in (db.feedback, db.feedback_archive):
+            for storage_format in FeedbackCodec.formats():
+                query = {"_id": ObjectId(feedback_id), **tenant_filter(), **FeedbackCodec.layout_filter(storage_format)}
+                query.update(await FeedbackCodec.encode_fields(conditions, storage_format))
+                result = await collection.find_one_and_update(
+                    query,
+                    {
+                        "$set": await FeedbackCodec.encode_fields(changes, storage_format),
+                        "$inc": await FeedbackCodec.encode_fields({"version": 1}, storage_format)
+                    },
+                    return_document=ReturnDocument.AFTER,
+                    session=session
+                )
+                if result:
+                    record_write(session)
+                    feedback_data = await FeedbackCodec.decode(result)
+                    index_feedback(feedback_data)
+                    return feedback_data
         return None
 
+    @staticmethod
+    async def update_feedback(feedback_id: str, update_data: dict, manager_id: Optional[str] = None, version: Optional[int] = None) -> Optional[Feedback]:
+        """Update feedback in a single write, if given by ``manager_id`` and still at ``version``.
+
+        Returns None when nothing matched; the caller tells a missing document
+        from a foreign or concurrently modified one.
+        """
+        conditions = {}
+        if manager_id is not None:
+            conditions["manager_id"] = ObjectId(manager_id)
+        if version is not None:
+            # Version 0 is stored as a missing field, which null matches.
+            conditions["version"] = version or None
+        update_data["updated_at"] = datetime.utcnow()
+        text_changed = "strengths" in update_data or "improvements" in update_data
+        if text_changed:
+            # The prediction described the old text; drop it until the
+            # classifier has scored the new one.
+            update_data["predicted_sentiment"] = None
+            update_data["sentiment_confidence"] = None
+        result = await FeedbackDB._update_one(feedback_id, conditions, update_data)
+        if not result:
+            return None
+        if text_changed:
+            from database import get_sentiment_pipeline
+            sentiment_pipeline = get_sentiment_pipeline()
+            if sentiment_pipeline is not None:
+                sentiment_pipeline.submit(result["_id"])
+        return Feedback(**result)
+
     @staticmethod
     async def get_feedback_by_id(feedback_id: str) -> Optional[Feedback]:
         from database import get_database
         db = get_database()
-        feedback_data = await db.feedback.find_one({"_id": ObjectId(feedback_id)})
+        query = {"_id": ObjectId(feedback_id), **tenant_filter()}
+        feedback_data = await db.feedback.find_one(query)
+        if feedback_data is None:
+            feedback_data = await db.feedback_archive.find_one(query)
         if feedback_data:
+            feedback_data = await FeedbackCodec.decode(feedback_data)
+            index_feedback(feedback_data)
             return Feedback(**feedback_data)
         return None
 
     @staticmethod
-    async def acknowledge_feedback(feedback_id: str, comment: Optional[str] = None) -> bool:
-        from database import get_database
-        db = get_database()
+    async def acknowledge_feedback(feedback_id: str, employee_id: str, comment: Optional[str] = None) -> bool:
+        """Acknowledge unacknowledged feedback, if ``employee_id`` received it."""
         update_data = {
             "acknowledged": True,
             "acknowledged_at": datetime.utcnow(),
@@ -216,8 +850,81 @@ class FeedbackDB:
         if comment:
             update_data["acknowledgment_comment"] = comment
             
-        result = await db.feedback.update_one(
-            {"_id": ObjectId(feedback_id)},
-            {"$set": update_data}
+        result = await FeedbackDB._update_one(
+            feedback_id, {"employee_id": ObjectId(employee_id), "acknowledged": False}, update_data
+        )
+        return result is not None
+
+
+class FeedbackRequestDB:
+    @staticmethod
+    async def record_request(employee_id: str, manager_id: str) -> Tuple[FeedbackRequest, bool]:
+        """Record a feedback request, folding repeats into the open one.
+
+        A request is a repeat while an earlier one for the same pair is still
+        unfulfilled and either waiting for the digest or was made within the
+        dedup window. Returns the request and whether a new one was created.
+        """
+        from database import get_database
+        db = get_database()
+        now = datetime.utcnow()
+        window_start = now - timedelta(hours=FEEDBACK_REQUEST_DEDUP_HOURS)
+
+        for _ in range(2):
+            existing = await db.feedback_requests.find_one_and_update(
+                {
+                    **tenant_filter(),
+                    "employee_id": ObjectId(employee_id),
+                    "manager_id": ObjectId(manager_id),
+                    "fulfilled_at": None,
+                    "$or": [
+                        {"status": {"$in": [FeedbackRequestStatus.pending, FeedbackRequestStatus.sending]}},
+                        {"requested_at": {"$gte": window_start}}
+                    ]
+                },
+                {"$inc": {"request_count": 1}, "$set": {"last_requested_at": now}},
+                sort=[("requested_at", -1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if existing:
+                return FeedbackRequest(**existing), False
+
+            request_data = {
+                "org_id": tenant_filter().get("org_id", DEFAULT_ORG_ID),
+                "employee_id": ObjectId(employee_id),
+                "manager_id": ObjectId(manager_id),
+                "status": FeedbackRequestStatus.pending,
+                "request_count": 1,
+                "requested_at": now,
+                "last_requested_at": now,
+                "sent_at": None,
+                "fulfilled_at": None
+            }
+            try:
+                result = await db.feedback_requests.insert_one(request_data)
+            except DuplicateKeyError:
+                # A concurrent request for the same pair won the insert.
+                continue
+            request_data["_id"] = result.inserted_id
+            return FeedbackRequest(**request_data), True
+
+        raise RuntimeError("Could not record feedback request")
+
+    @staticmethod
+    async def get_open_requests_for_manager(manager_id: str) -> List[FeedbackRequest]:
+        feedback_requests, session = await routed_read("feedback_requests")
+        cursor = feedback_requests.find(
+            {**tenant_filter(), "manager_id": ObjectId(manager_id), "fulfilled_at": None},
+            session=session
+        ).sort("requested_at", -1)
+        return [FeedbackRequest(**request_data) async for request_data in cursor]
+
+    @staticmethod
+    async def fulfill_requests(manager_id: str, employee_id: str) -> int:
+        from database import get_database
+        db = get_database()
+        result = await db.feedback_requests.update_many(
+            {**tenant_filter(), "manager_id": ObjectId(manager_id), "employee_id": ObjectId(employee_id), "fulfilled_at": None},
+            {"$set": {"fulfilled_at": datetime.utcnow()}}
         )
-        return result.modified_count > 0
\ No newline at end of file
+        return result.modified_count
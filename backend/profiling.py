@@ -0,0 +1,268 @@
+"""Opt-in per-request profiling.
+
+A request is profiled when it carries ``X-Profile: <PROFILING_TOKEN>`` or is
+picked by ``PROFILING_SAMPLE_RATE``. Profiles from all workers are kept in a
+capped collection and served by the admin endpoints as collapsed stacks,
+the input format of flamegraph.pl and speedscope. When neither trigger is configured
+the middleware is not installed at all.
+
+Profiles are per request (``scope: "request"``) with pyinstrument, which is
+in requirements.txt. If it is not installed, the cProfile fallback records
+everything that runs on the event loop thread while the request is in
+flight, including other concurrent requests, and marks the profile
+``scope: "loop"``.
+"""
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+try:
+    # Pinned in requirements.txt: its async mode attributes time spent
+    # awaiting to the request being profiled instead of whatever else the
+    # loop ran. cProfile is only a fallback for environments without it.
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_BUFFER_SIZE = int(os.getenv("PROFILING_BUFFER_SIZE", "50"))
+# Upper bound on the capped collection's size; whichever limit is hit first
+# evicts the oldest profile.
+PROFILING_COLLECTION_BYTES = int(os.getenv("PROFILING_COLLECTION_BYTES", str(64 * 1024 * 1024)))
+PROFILES_COLLECTION = "profiles"
+PROFILING_HEADER = "X-Profile"
+# pyinstrument's sampling interval.
+PROFILING_INTERVAL_SECONDS = float(os.getenv("PROFILING_INTERVAL_SECONDS", "0.001"))
+
+PROFILE_SCOPE_REQUEST = "request"
+PROFILE_SCOPE_LOOP = "loop"
+
+
+def profile_scope() -> str:
+    """What a profile taken by this process covers."""
+    return PROFILE_SCOPE_REQUEST if pyinstrument is not None else PROFILE_SCOPE_LOOP
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILING_TOKEN) or PROFILING_SAMPLE_RATE > 0
+
+
+def _frame_name(function: str, file_path: Optional[str], line_no: Optional[int]) -> str:
+    # Collapsed stacks use ";" between frames, so it may not appear in a name.
+    if file_path and line_no:
+        name = f"{function} ({file_path}:{line_no})"
+    elif file_path:
+        name = f"{function} ({file_path})"
+    else:
+        name = function
+    return name.replace(";", ":")
+
+
+def collapse_pyinstrument(root_frame) -> List[str]:
+    """Collapsed stack lines (``frame;frame;frame microseconds``) from a pyinstrument tree."""
+    lines: Dict[str, int] = {}
+
+    def walk(frame, stack: Tuple[str, ...]):
+        stack = stack + (_frame_name(frame.function, frame.file_path_short, frame.line_no),)
+        self_time = frame.time - sum(child.time for child in frame.children)
+        if self_time > 0:
+            key = ";".join(stack)
+            lines[key] = lines.get(key, 0) + int(self_time * 1e6)
+        for child in frame.children:
+            walk(child, stack)
+
+    if root_frame is not None:
+        walk(root_frame, ())
+    return [f"{stack} {micros}" for stack, micros in lines.items() if micros > 0]
+
+
+def collapse_cprofile(profile: cProfile.Profile) -> List[str]:
+    """Approximate collapsed stacks from cProfile's caller/callee graph.
+
+    cProfile only records edges, so a function's time is split across the
+    paths leading to it in proportion to the time each caller spent in it.
+    """
+    stats = pstats.Stats(profile).stats
+    callees: Dict[tuple, List[Tuple[tuple, float]]] = {}
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, edge_time) in callers.items():
+            callees.setdefault(caller, []).append((function, edge_time))
+
+    def name(function: tuple) -> str:
+        file_path, line_no, function_name = function
+        if file_path == "~":
+            return _frame_name(function_name, None, None)
+        return _frame_name(function_name, os.path.basename(file_path), line_no)
+
+    lines: Dict[str, int] = {}
+
+    def walk(function: tuple, budget: float, stack: Tuple[str, ...], on_stack: frozenset):
+        _, _, self_time, total_time, _ = stats[function]
+        if total_time <= 0:
+            return
+        share = min(1.0, budget / total_time)
+        stack = stack + (name(function),)
+        micros = int(self_time * share * 1e6)
+        if micros > 0:
+            key = ";".join(stack)
+            lines[key] = lines.get(key, 0) + micros
+        for callee, edge_time in callees.get(function, []):
+            if callee not in on_stack and callee in stats:
+                walk(callee, edge_time * share, stack, on_stack | {callee})
+
+    roots = [function for function, (_, _, _, _, callers) in stats.items() if not callers]
+    for root in roots:
+        walk(root, stats[root][3], (), frozenset([root]))
+    return [f"{stack} {micros}" for stack, micros in lines.items()]
+
+
+def start_profiler():
+    if pyinstrument is not None:
+        profiler = pyinstrument.Profiler(interval=PROFILING_INTERVAL_SECONDS, async_mode="enabled")
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+
+def stop_profiler(profiler) -> List[str]:
+    """Stop ``profiler`` and return its collapsed stack lines."""
+    if pyinstrument is not None:
+        return collapse_pyinstrument(profiler.stop().root_frame())
+    profiler.disable()
+    return collapse_cprofile(profiler)
+
+
+def top_functions(lines: List[str], limit: int = 20) -> List[Tuple[str, int]]:
+    """Leaf frames with the most self time, from collapsed stack lines."""
+    totals: Dict[str, int] = {}
+    for line in lines:
+        stack, _, micros = line.rpartition(" ")
+        leaf = stack.rsplit(";", 1)[-1]
+        totals[leaf] = totals.get(leaf, 0) + int(micros)
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+class ProfileStore:
+    """The last ``size`` profiles captured by any worker.
+
+    Kept in the capped ``profiles`` collection rather than in memory, so the
+    admin endpoints see every worker's profiles whichever worker serves them.
+    """
+
+    def __init__(self, size: int = PROFILING_BUFFER_SIZE):
+        self.size = size
+
+    async def create_collection(self, db):
+        try:
+            await db.create_collection(
+                PROFILES_COLLECTION, capped=True, size=PROFILING_COLLECTION_BYTES, max=self.size
+            )
+        except CollectionInvalid:
+            # Already exists.
+            pass
+
+    async def add(self, profile: dict) -> dict:
+        from database import get_database
+        profile["_id"] = ObjectId()
+        await get_database()[PROFILES_COLLECTION].insert_one(profile)
+        return profile
+
+    async def list(self) -> List[dict]:
+        from database import get_database
+        cursor = get_database()[PROFILES_COLLECTION].find({}, {"stacks": 0}).sort("_id", -1).limit(self.size)
+        return [_with_id(profile) async for profile in cursor]
+
+    async def get(self, profile_id: str) -> Optional[dict]:
+        from database import get_database
+        if not ObjectId.is_valid(profile_id):
+            return None
+        profile = await get_database()[PROFILES_COLLECTION].find_one({"_id": ObjectId(profile_id)})
+        return _with_id(profile) if profile else None
+
+
+def _with_id(profile: dict) -> dict:
+    profile["id"] = str(profile.pop("_id"))
+    return profile
+
+
+profile_store = ProfileStore()
+
+
+class ProfilingMiddleware:
+    """Profiles requests triggered by the admin header or by sampling.
+
+    Only one request is profiled at a time per process: Python allows a
+    single active profiler per thread, and every request shares the event
+    loop thread.
+    """
+
+    def __init__(self, app, token: str = PROFILING_TOKEN, sample_rate: float = PROFILING_SAMPLE_RATE, store: ProfileStore = profile_store):
+        self.app = app
+        self.token = token.encode()
+        self.sample_rate = sample_rate
+        self.store = store
+        self._active = False
+
+    def _trigger(self, scope) -> Optional[str]:
+        if self.token:
+            for key, value in scope.get("headers", []):
+                if key == b"x-profile" and hmac.compare_digest(value, self.token):
+                    return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._active:
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": None}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        self._active = True
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        profiler = start_profiler()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            stacks = stop_profiler(profiler)
+            self._active = False
+            await self._save({
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status["code"],
+                "trigger": trigger,
+                "profiler": "pyinstrument" if pyinstrument is not None else "cprofile",
+                "scope": profile_scope(),
+                "started_at": started_at,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                "top": top_functions(stacks),
+                "stacks": stacks,
+            })
+
+    async def _save(self, profile: dict):
+        try:
+            await self.store.add(profile)
+        except PyMongoError as e:
+            print(f"Failed to store profile of {profile['method']} {profile['path']}: {e}")
@@ -0,0 +1,132 @@
+import enum
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from bson import Timestamp
+from pymongo import monitoring
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+# Mongo rejects maxStalenessSeconds below 90.
+ANALYTICS_MAX_STALENESS_SECONDS = max(90, int(os.getenv("ANALYTICS_MAX_STALENESS_SECONDS", "90")))
+# After writing, a user's own reads stay on the primary for this long so they
+# see their change even when the client does not send a causal token.
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", str(ANALYTICS_MAX_STALENESS_SECONDS)))
+CAUSAL_TOKEN_HEADER = "X-Causal-Token"
+
+READ_COMMANDS = {"find", "getMore", "aggregate", "count", "countDocuments", "distinct"}
+
+
+class ReadRoute(str, enum.Enum):
+    # Authentication and anything that must observe the latest write.
+    primary = "primary"
+    # List and stats reads that tolerate bounded staleness.
+    secondary = "secondary"
+
+
+READ_PREFERENCES = {
+    ReadRoute.primary: Primary(),
+    ReadRoute.secondary: SecondaryPreferred(max_staleness=ANALYTICS_MAX_STALENESS_SECONDS),
+}
+
+
+def encode_causal_token(operation_time: Optional[Timestamp]) -> Optional[str]:
+    if operation_time is None:
+        return None
+    return f"{operation_time.time}.{operation_time.inc}"
+
+
+def decode_causal_token(token: Optional[str]) -> Optional[Timestamp]:
+    if not token:
+        return None
+    try:
+        seconds, increment = token.split(".", 1)
+        return Timestamp(int(seconds), int(increment))
+    except (ValueError, TypeError):
+        return None
+
+
+class RecentWriters:
+    """Users who wrote within the read-your-writes window, per process."""
+
+    def __init__(self, window_seconds: int = READ_YOUR_WRITES_SECONDS):
+        self.window_seconds = window_seconds
+        self._writes: Dict[str, float] = {}
+
+    def mark(self, user_id: str):
+        now = time.monotonic()
+        self._writes[user_id] = now
+        if len(self._writes) > 10000:
+            cutoff = now - self.window_seconds
+            self._writes = {key: at for key, at in self._writes.items() if at >= cutoff}
+
+    def is_recent(self, user_id: str) -> bool:
+        written_at = self._writes.get(user_id)
+        return written_at is not None and time.monotonic() - written_at < self.window_seconds
+
+
+recent_writers = RecentWriters()
+
+
+class ReadMetrics(monitoring.CommandListener, monitoring.TopologyListener):
+    """Counts reads per requested route and per member that actually served them.
+
+    Registered on the Mongo clients as an event listener, so it sees the
+    server each read command ran on and the current replica-set topology.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routed = Counter()
+        self._served = Counter()
+        self._secondaries = set()
+
+    def record_route(self, route: ReadRoute):
+        with self._lock:
+            self._routed[route.value] += 1
+
+    # CommandListener
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if event.command_name not in READ_COMMANDS:
+            return
+        member = "secondary" if event.connection_id in self._secondaries else "primary"
+        with self._lock:
+            self._served[member] += 1
+
+    def failed(self, event):
+        pass
+
+    # TopologyListener
+    def opened(self, event):
+        pass
+
+    def description_changed(self, event):
+        self._secondaries = {
+            address
+            for address, description in event.new_description.server_descriptions().items()
+            if description.server_type_name == "RSSecondary"
+        }
+
+    def closed(self, event):
+        pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routed, served = dict(self._routed), dict(self._served)
+        routed_total = sum(routed.values())
+        served_total = sum(served.values())
+        return {
+            "routed": routed,
+            "served": served,
+            "secondary_routed_ratio": routed.get(ReadRoute.secondary.value, 0) / routed_total if routed_total else 0.0,
+            "secondary_served_ratio": served.get("secondary", 0) / served_total if served_total else 0.0,
+            "max_staleness_seconds": ANALYTICS_MAX_STALENESS_SECONDS,
+        }
+
+
+read_metrics = ReadMetrics()
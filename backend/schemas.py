@@ -1,8 +1,9 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Any, Optional, List, Dict
 from datetime import datetime
 from enum import Enum
-from models import UserRole  
+from models import UserRole, FeedbackRequestStatus
+from jobs import JobStatus
 
 class UserRole(str, Enum):
     manager = "manager"
@@ -19,6 +20,9 @@ class UserCreate(BaseModel):
     full_name: str
     role: UserRole
     manager_id: Optional[str] = None
+    # Joins the organization that issued it; employees otherwise join their
+    # manager's organization and everyone else the default one.
+    invite_code: Optional[str] = None
 
 class UserLogin(BaseModel):
     email: EmailStr
@@ -70,6 +74,9 @@ class FeedbackResponse(BaseModel):
     giver_name: str
     receiver_name: str
     giver_role: UserRole
+    version: int = 0
+    predicted_sentiment: Optional[SentimentType] = None
+    sentiment_confidence: Optional[float] = None
     
     manager_id: Optional[str] = None
     employee_id: Optional[str] = None
@@ -77,4 +84,53 @@ class FeedbackResponse(BaseModel):
     employee_name: Optional[str] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class FeedbackRequestResponse(BaseModel):
+    id: str
+    employee_id: str
+    employee_name: str
+    status: FeedbackRequestStatus
+    request_count: int
+    requested_at: datetime
+    last_requested_at: datetime
+    sent_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
+
+class DashboardResponse(BaseModel):
+    user: UserResponse
+    team: List[UserResponse]
+    stats: Dict[str, int]
+    recent_feedback: List[FeedbackResponse]
+
+class JobCreate(BaseModel):
+    type: str
+    params: Dict[str, Any] = {}
+
+class JobResponse(BaseModel):
+    id: str
+    type: str
+    params: Dict[str, Any]
+    status: JobStatus
+    attempts: int
+    max_attempts: int
+    progress: Dict[str, Any]
+    result: Optional[Dict[str, Any]]
+    error: Optional[str]
+    created_by: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+class OrganizationCreate(BaseModel):
+    org_id: str
+    name: str
+
+class OrganizationResponse(BaseModel):
+    org_id: str
+    name: str
+    invite_code: str
+    created_at: datetime
@@ -0,0 +1,287 @@
+"""Local lexicon classifier that predicts the sentiment of feedback text.
+
+New feedback is queued by ``FeedbackDB.create_feedback`` and classified in
+micro-batches by ``SentimentPipeline`` in a process pool, so scoring never runs
+on the request path. Feedback the pipeline missed (queue full, worker
+restart, or everything written before it existed) is covered by the
+``classify_sentiment`` background job, which calls ``backfill_sentiment``.
+"""
+import asyncio
+import multiprocessing
+import os
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from models import (
+    FeedbackCodec, SentimentType, FEEDBACK_FORMAT_COMPACT, FEEDBACK_FORMAT_LEGACY
+)
+
+SENTIMENT_CLASSIFIER_ENABLED = os.getenv("SENTIMENT_CLASSIFIER_ENABLED", "1") == "1"
+SENTIMENT_WORKERS = int(os.getenv("SENTIMENT_WORKERS", "2"))
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "64"))
+# How long the pipeline waits to fill a batch before classifying what it has.
+SENTIMENT_BATCH_WAIT_SECONDS = float(os.getenv("SENTIMENT_BATCH_WAIT_SECONDS", "0.5"))
+SENTIMENT_QUEUE_SIZE = int(os.getenv("SENTIMENT_QUEUE_SIZE", "10000"))
+
+CLASSES = [SentimentType.positive, SentimentType.neutral, SentimentType.constructive]
+
+POSITIVE_TERMS = (
+    "great", "excellent", "outstanding", "strong", "impressive", "helpful", "proactive",
+    "reliable", "clear", "thorough", "creative", "collaborative", "supportive", "consistent",
+    "efficient", "exceptional", "fantastic", "good", "well", "appreciate", "appreciated",
+    "thanks", "thank", "insightful", "dependable", "amazing", "awesome", "love", "excels",
+    "excelled", "skilled", "quick", "organized", "positive", "leadership", "ownership",
+    "initiative", "mentoring", "praise", "kudos", "solid", "valuable", "success",
+    "successful", "delivered", "impact", "brilliant", "talented", "professional",
+)
+CONSTRUCTIVE_TERMS = (
+    "improve", "improvement", "improving", "should", "could", "needs", "need", "missed",
+    "miss", "late", "delay", "delayed", "unclear", "inconsistent", "lacking", "lack",
+    "lacks", "struggle", "struggled", "struggles", "confusing", "sloppy", "errors",
+    "error", "mistakes", "mistake", "issue", "issues", "concern", "concerns", "however",
+    "rushed", "incomplete", "poor", "slow", "difficult", "blocked", "bugs", "overdue",
+    "careless", "disorganized", "defensive", "focus", "try", "instead", "avoid", "harder",
+)
+NEGATIONS = {"not", "no", "never", "isn't", "wasn't", "don't", "doesn't", "didn't", "hardly"}
+TOKEN_PATTERN = re.compile(r"[a-z']+")
+
+# Logit the neutral class gets with no lexicon hits at all.
+NEUTRAL_BIAS = 0.6
+# Hits per token are scaled by this before scoring, so one strong word in a
+# short sentence is decisive but a long text needs several.
+DENSITY_SCALE = 12.0
+# Praise under "improvements" is usually softened criticism ("good, but ...").
+IMPROVEMENTS_FIELD_SCALE = np.array([0.5, 1.0, 1.5])
+
+
+class LexiconModel:
+    """Linear model over lexicon hit densities in ``strengths`` and ``improvements``.
+
+    Each text pair becomes a row of per-term hit densities for both fields
+    (plus a bias column); one matrix product gives the class logits for a
+    whole batch.
+    """
+
+    def __init__(self):
+        terms = list(dict.fromkeys(POSITIVE_TERMS + CONSTRUCTIVE_TERMS))
+        # A negated term ("not clear") counts towards the opposite class.
+        vocabulary = terms + [f"not_{term}" for term in terms]
+        self.index = {term: position for position, term in enumerate(vocabulary)}
+
+        weights = np.zeros((len(vocabulary), len(CLASSES)))
+        positive, constructive = CLASSES.index(SentimentType.positive), CLASSES.index(SentimentType.constructive)
+        for term in POSITIVE_TERMS:
+            weights[self.index[term], positive] += 1.0
+            weights[self.index[f"not_{term}"], constructive] += 1.0
+        for term in CONSTRUCTIVE_TERMS:
+            weights[self.index[term], constructive] += 1.0
+            weights[self.index[f"not_{term}"], positive] += 0.5
+
+        bias = np.zeros((1, len(CLASSES)))
+        bias[0, CLASSES.index(SentimentType.neutral)] = NEUTRAL_BIAS
+        self.weights = np.vstack([weights, weights * IMPROVEMENTS_FIELD_SCALE, bias])
+
+    def _hits(self, text: str, row: np.ndarray, offset: int):
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        negated = False
+        for token in tokens:
+            if token in NEGATIONS or token.endswith("n't"):
+                negated = True
+                continue
+            position = self.index.get(f"not_{token}" if negated else token)
+            if position is not None:
+                row[offset + position] += 1
+            negated = False
+        if tokens:
+            row[offset:offset + len(self.index)] *= DENSITY_SCALE / len(tokens)
+
+    def features(self, texts: Sequence[Tuple[str, str]]) -> np.ndarray:
+        size = len(self.index)
+        matrix = np.zeros((len(texts), 2 * size + 1))
+        matrix[:, -1] = 1.0
+        for row, (strengths, improvements) in zip(matrix, texts):
+            self._hits(strengths or "", row, 0)
+            self._hits(improvements or "", row, size)
+        return matrix
+
+    def predict(self, texts: Sequence[Tuple[str, str]]) -> List[Tuple[str, float]]:
+        if not texts:
+            return []
+        logits = self.features(texts) @ self.weights
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        best = probabilities.argmax(axis=1)
+        return [
+            (CLASSES[label].value, round(float(probabilities[row, label]), 4))
+            for row, label in enumerate(best)
+        ]
+
+
+_model: Optional[LexiconModel] = None
+
+
+def classify_batch(texts: Sequence[Tuple[str, str]]) -> List[Tuple[str, float]]:
+    """Predict ``(sentiment, confidence)`` per ``(strengths, improvements)`` pair.
+
+    Runs inside the process pool; each worker builds the model once.
+    """
+    global _model
+    if _model is None:
+        _model = LexiconModel()
+    return _model.predict(texts)
+
+
+def create_executor(workers: int = SENTIMENT_WORKERS) -> ProcessPoolExecutor:
+    # Spawned rather than forked: the parent runs Mongo driver threads.
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+async def classify_documents(collection, documents: List[dict], executor: Executor) -> List[Tuple[dict, str, float]]:
+    """Classify stored feedback documents and save the predictions on them.
+
+    Predictions are not edits: they leave ``updated_at`` and ``version`` alone,
+    and are only saved if ``updated_at`` is still what was classified, so a
+    prediction for text edited meanwhile is dropped (the edit queues its own).
+    Returns ``(decoded document, predicted sentiment, confidence)`` triples.
+    """
+    if not documents:
+        return []
+    decoded = await FeedbackCodec.decode_many(documents)
+    texts = [(feedback_data.get("strengths", ""), feedback_data.get("improvements", "")) for feedback_data in decoded]
+    predictions = await asyncio.get_running_loop().run_in_executor(executor, classify_batch, texts)
+
+    requests = []
+    for document, feedback_data, (sentiment, confidence) in zip(documents, decoded, predictions):
+        storage_format = FeedbackCodec.storage_format(document)
+        changes = await FeedbackCodec.encode_fields(
+            {"predicted_sentiment": sentiment, "sentiment_confidence": confidence}, storage_format
+        )
+        unchanged = await FeedbackCodec.encode_fields({"updated_at": feedback_data.get("updated_at")}, storage_format)
+        # org_id completes the shard key, so each update targets one shard.
+        shard_key = {"org_id": document.get("org_id"), "_id": document["_id"]}
+        requests.append(UpdateOne(
+            {**shard_key, **FeedbackCodec.layout_filter(storage_format), **unchanged},
+            {"$set": changes}
+        ))
+    await collection.bulk_write(requests, ordered=False)
+    return [(feedback_data, sentiment, confidence) for feedback_data, (sentiment, confidence) in zip(decoded, predictions)]
+
+
+def unclassified_filter() -> dict:
+    return {"$or": [
+        {**FeedbackCodec.layout_filter(FEEDBACK_FORMAT_LEGACY), "predicted_sentiment": None},
+        {**FeedbackCodec.layout_filter(FEEDBACK_FORMAT_COMPACT), "ps": None},
+    ]}
+
+
+async def backfill_sentiment(
+    db,
+    collection_name: str,
+    executor: Executor,
+    reclassify: bool = False,
+    batch_size: int = SENTIMENT_BATCH_SIZE,
+    start_after: Optional[ObjectId] = None,
+    on_batch: Optional[Callable[[ObjectId, Dict[str, int]], Awaitable[Any]]] = None
+) -> Dict[str, int]:
+    """Classify feedback in ``_id`` order, by default only what has no prediction.
+
+    Counts how many predictions disagree with the sentiment the author
+    picked. ``on_batch(last_id, counts)`` is awaited after every batch so the
+    caller can checkpoint and resume with ``start_after``.
+    """
+    collection = db[collection_name]
+    counts = {"classified": 0, "disagreements": 0}
+    last_id = start_after
+    while True:
+        query = {} if reclassify else unclassified_filter()
+        if last_id is not None:
+            query = {**query, "_id": {"$gt": last_id}}
+        batch = await collection.find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        for feedback_data, sentiment, _ in await classify_documents(collection, batch, executor):
+            counts["classified"] += 1
+            if feedback_data.get("sentiment") != sentiment:
+                counts["disagreements"] += 1
+        if on_batch is not None:
+            await on_batch(last_id, counts)
+    return counts
+
+
+class SentimentPipeline:
+    """Classifies newly created feedback in micro-batches off the request path."""
+
+    def __init__(self, db, batch_size: int = SENTIMENT_BATCH_SIZE, batch_wait_seconds: float = SENTIMENT_BATCH_WAIT_SECONDS):
+        self.db = db
+        self.batch_size = batch_size
+        self.batch_wait_seconds = batch_wait_seconds
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SENTIMENT_QUEUE_SIZE)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if SENTIMENT_CLASSIFIER_ENABLED and self._task is None:
+            self._executor = create_executor()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def submit(self, feedback_id: ObjectId):
+        """Queue feedback for classification; never blocks."""
+        if self._task is None:
+            return
+        try:
+            self.queue.put_nowait(feedback_id)
+        except asyncio.QueueFull:
+            # The classify_sentiment backfill job picks it up later.
+            pass
+
+    async def _next_batch(self) -> List[ObjectId]:
+        loop = asyncio.get_running_loop()
+        feedback_ids = [await self.queue.get()]
+        deadline = loop.time() + self.batch_wait_seconds
+        while len(feedback_ids) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                feedback_ids.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return feedback_ids
+
+    async def _run(self):
+        while True:
+            feedback_ids = await self._next_batch()
+            try:
+                documents = await self.db.feedback.find({"_id": {"$in": feedback_ids}}).to_list(None)
+                await classify_documents(self.db.feedback, documents, self._executor)
+                # Feedback edited after it was archived, or archived while queued.
+                found = {document["_id"] for document in documents}
+                missing = [feedback_id for feedback_id in feedback_ids if feedback_id not in found]
+                if missing:
+                    archived = await self.db.feedback_archive.find({"_id": {"$in": missing}}).to_list(None)
+                    await classify_documents(self.db.feedback_archive, archived, self._executor)
+            except asyncio.CancelledError:
+                raise
+            except (PyMongoError, OSError, RuntimeError) as e:
+                print(f"Sentiment classification failed for {len(feedback_ids)} feedback: {e}")
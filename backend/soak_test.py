@@ -0,0 +1,512 @@
+"""Soak test the API with several uvicorn workers and gate on a stored baseline.
+
+    python soak_test.py [--workers 4] [--clients 8] [--duration 120]
+                        [--managers 20] [--team-size 8] [--feedback-per-employee 10]
+                        [--baseline soak_baseline.json] [--threshold 0.2] [--update-baseline]
+
+Seeds a throwaway database on MONGODB_URL (``--database``, dropped before and
+after the run), starts ``uvicorn main:app --workers N`` against it and runs
+client processes that log in as the seeded managers and employees and replay
+a mix of listing, stats, team, create and acknowledge requests over
+keep-alive connections.
+
+Reported per run: latency percentiles and error rate per endpoint, Mongo
+operations per request (``serverStatus`` opcounters, so run it against a
+mongod nothing else is using) and peak RSS per uvicorn worker. With a
+baseline, every gated metric must stay within ``--threshold`` of it (plus a
+small absolute allowance for noise) or the script exits with status 1.
+Baselines are only comparable between runs with the same configuration and
+on the same machine.
+"""
+import argparse
+import gzip
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from passlib.context import CryptContext
+from pymongo import MongoClient
+
+from bench_compression import WORDS, sentence
+from models import DEFAULT_ORG_ID
+
+HOST = "127.0.0.1"
+PASSWORD = "soak-password"
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Share of client requests per operation. A "login" switches the client to
+# another seeded user.
+MIX = {
+    "list_feedback": 30,
+    "stats": 20,
+    "team": 15,
+    "create_feedback": 15,
+    "acknowledge": 10,
+    "login": 10,
+}
+PERCENTILES = {"p50_ms": 0.50, "p95_ms": 0.95, "p99_ms": 0.99}
+# Absolute allowance added to the relative threshold, so metrics close to
+# zero do not fail on noise.
+ALLOWANCES = {
+    "_ms": 2.0,
+    "error_rate": 0.001,
+    "mongo_ops_per_request": 0.1,
+    "worker_rss_mb": 10.0,
+}
+
+
+def seed(db, managers: int, team_size: int, feedback_per_employee: int, rng: random.Random) -> Tuple[List[dict], int]:
+    """Insert managers with their teams and feedback between them.
+
+    Returns the users as clients see them and the number of feedback inserted.
+    """
+    db.client.drop_database(db.name)
+    hashed_password = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(PASSWORD)
+    now = datetime.utcnow()
+
+    def user(email: str, full_name: str, role: str, manager_id: Optional[ObjectId]) -> dict:
+        return {
+            "_id": ObjectId(),
+            "email": email,
+            "full_name": full_name,
+            "role": role,
+            "org_id": DEFAULT_ORG_ID,
+            "manager_id": manager_id,
+            "hashed_password": hashed_password,
+            "created_at": now,
+            "updated_at": now,
+        }
+
+    users, feedback = [], []
+    for manager_number in range(managers):
+        manager = user(f"manager{manager_number}@soak.test", f"Manager {manager_number}", "manager", None)
+        team = [
+            user(f"employee{manager_number}-{number}@soak.test", f"Employee {manager_number}-{number}", "employee", manager["_id"])
+            for number in range(team_size)
+        ]
+        users += [manager] + team
+        for employee in team:
+            peers = [peer for peer in team if peer is not employee]
+            for _ in range(feedback_per_employee):
+                giver = manager if not peers or rng.random() < 0.7 else rng.choice(peers)
+                created_at = now - timedelta(minutes=rng.randint(0, 500000))
+                acknowledged = rng.random() < 0.5
+                feedback.append({
+                    # Backdate the _id too: pagination, the archiver and the
+                    # shard key all order feedback by it. The sequence number
+                    # keeps ids created in the same second unique.
+                    "_id": ObjectId(ObjectId.from_datetime(created_at).binary[:4] + len(feedback).to_bytes(8, "big")),
+                    "org_id": DEFAULT_ORG_ID,
+                    "manager_id": giver["_id"],
+                    "employee_id": employee["_id"],
+                    "strengths": sentence(rng, rng.randint(8, 30)),
+                    "improvements": sentence(rng, rng.randint(8, 30)),
+                    "sentiment": rng.choice(["positive", "neutral", "constructive"]),
+                    "tags": rng.sample(WORDS, rng.randint(0, 3)),
+                    "anonymous": giver is not manager and rng.random() < 0.2,
+                    "acknowledged": acknowledged,
+                    "acknowledged_at": created_at if acknowledged else None,
+                    "acknowledgment_comment": None,
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                    "version": 1,
+                })
+
+    db.users.insert_many(users)
+    if feedback:
+        db.feedback.insert_many(feedback, ordered=False)
+    return [
+        {
+            "id": str(seeded["_id"]),
+            "email": seeded["email"],
+            "role": seeded["role"],
+            "manager_id": str(seeded["manager_id"]) if seeded["manager_id"] else None,
+        }
+        for seeded in users
+    ], len(feedback)
+
+
+def launch(database_name: str, port: int, workers: int) -> subprocess.Popen:
+    env = {**os.environ, "DATABASE_NAME": database_name}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", HOST, "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+def wait_until_ready(server: subprocess.Popen, port: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+        connection = http.client.HTTPConnection(HOST, port, timeout=2)
+        try:
+            connection.request("GET", "/docs")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            connection.close()
+        time.sleep(0.5)
+    raise RuntimeError(f"uvicorn did not answer on port {port} within {timeout:.0f}s")
+
+
+def worker_pids(supervisor_pid: int, workers: int, timeout: float = 30.0) -> List[int]:
+    """Pids of the uvicorn worker processes spawned by ``supervisor_pid``."""
+    deadline = time.monotonic() + timeout
+    while True:
+        pids = []
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as stat:
+                    # The command name may contain spaces; fields after it don't.
+                    parent_pid = int(stat.read().rsplit(")", 1)[1].split()[1])
+                if parent_pid != supervisor_pid:
+                    continue
+                with open(f"/proc/{entry}/cmdline", "rb") as cmdline:
+                    if b"spawn_main" in cmdline.read():
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+        if len(pids) >= workers or time.monotonic() > deadline:
+            return sorted(pids)
+        time.sleep(0.5)
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def stop(server: subprocess.Popen):
+    if server.poll() is not None:
+        return
+    server.send_signal(signal.SIGINT)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def opcounters(client: MongoClient) -> Dict[str, int]:
+    return dict(client.admin.command("serverStatus")["opcounters"])
+
+
+class Client:
+    """One simulated user session on a keep-alive connection."""
+
+    def __init__(self, port: int, users: List[dict], rng: random.Random):
+        self.port = port
+        self.users = users
+        self.rng = rng
+        self.teams: Dict[str, List[str]] = defaultdict(list)
+        for seeded in users:
+            if seeded["manager_id"]:
+                self.teams[seeded["manager_id"]].append(seeded["id"])
+        self.connection = http.client.HTTPConnection(HOST, port, timeout=30)
+        self.user: Optional[dict] = None
+        self.token: Optional[str] = None
+        self.pending: List[str] = []
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Counter] = defaultdict(Counter)
+
+    def request(self, operation: str, method: str, path: str, body: Optional[dict] = None):
+        headers = {"Accept-Encoding": "gzip", "Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = self.connection.getresponse()
+            payload = response.read()
+            status = response.status
+            if response.getheader("Content-Encoding") == "gzip":
+                payload = gzip.decompress(payload)
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(HOST, self.port, timeout=30)
+            status, payload = 0, b""
+        self.latencies[operation].append((time.perf_counter() - start) * 1000)
+        if not 200 <= status < 300:
+            self.errors[operation][str(status)] += 1
+            return None
+        return json.loads(payload) if payload else None
+
+    def login(self):
+        self.user = self.rng.choice(self.users)
+        self.token = None
+        self.pending = []
+        result = self.request("login", "POST", "/api/auth/login", {"email": self.user["email"], "password": PASSWORD})
+        self.token = result["access_token"] if result else None
+
+    def list_feedback(self):
+        feedback = self.request("list_feedback", "GET", "/api/feedback")
+        if feedback is not None and self.user["role"] == "employee":
+            self.pending = [item["id"] for item in feedback if not item["acknowledged"]]
+
+    def create_feedback(self):
+        if self.user["role"] == "manager":
+            receivers = self.teams[self.user["id"]]
+        else:
+            receivers = [peer for peer in self.teams[self.user["manager_id"]] if peer != self.user["id"]]
+        if not receivers:
+            self.list_feedback()
+            return
+        self.request("create_feedback", "POST", "/api/feedback", {
+            "employee_id": self.rng.choice(receivers),
+            "strengths": sentence(self.rng, self.rng.randint(8, 30)),
+            "improvements": sentence(self.rng, self.rng.randint(8, 30)),
+            "sentiment": self.rng.choice(["positive", "neutral", "constructive"]),
+            "tags": self.rng.sample(WORDS, self.rng.randint(0, 3)),
+            "anonymous": self.user["role"] == "employee" and self.rng.random() < 0.2,
+        })
+
+    def acknowledge(self):
+        # Managers have nothing to acknowledge, and employees first need to
+        # have listed their feedback to know what is pending.
+        if self.user["role"] != "employee" or not self.pending:
+            self.list_feedback()
+            return
+        feedback_id = self.pending.pop()
+        self.request("acknowledge", "PATCH", f"/api/feedback/{feedback_id}/acknowledge", {"comment": "Thanks"})
+
+    def step(self, operation: str):
+        if operation == "login" or self.token is None:
+            self.login()
+        elif operation == "list_feedback":
+            self.list_feedback()
+        elif operation == "stats":
+            self.request("stats", "GET", "/api/stats")
+        elif operation == "team":
+            self.request("team", "GET", "/api/team")
+        elif operation == "create_feedback":
+            self.create_feedback()
+        elif operation == "acknowledge":
+            self.acknowledge()
+
+
+def run_client(number: int, port: int, users: List[dict], duration: float, seed_value: int) -> dict:
+    """Drive requests for ``duration`` seconds; runs in its own process."""
+    rng = random.Random(seed_value * 1000 + number)
+    client = Client(port, users, rng)
+    operations, weights = list(MIX), list(MIX.values())
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        client.step(rng.choices(operations, weights)[0])
+    client.connection.close()
+    return {"latencies": dict(client.latencies), "errors": {operation: dict(counts) for operation, counts in client.errors.items()}}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_load(args, users: List[dict], workers: List[int]) -> Tuple[dict, Dict[str, float], float]:
+    """Run the client processes, sampling worker RSS until they finish.
+
+    Returns the merged client results, peak RSS per worker pid and the
+    elapsed seconds.
+    """
+    peaks: Dict[str, float] = {}
+    context = multiprocessing.get_context("spawn")
+    start = time.monotonic()
+    with context.Pool(args.clients) as pool:
+        pending = pool.starmap_async(
+            run_client, [(number, args.port, users, args.duration, args.seed) for number in range(args.clients)]
+        )
+        while not pending.ready():
+            for pid in workers:
+                current = rss_mb(pid)
+                if current is not None:
+                    peaks[str(pid)] = max(peaks.get(str(pid), 0.0), current)
+            pending.wait(1.0)
+        results = pending.get()
+    elapsed = time.monotonic() - start
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, Counter] = defaultdict(Counter)
+    for result in results:
+        for operation, values in result["latencies"].items():
+            latencies[operation].extend(values)
+        for operation, counts in result["errors"].items():
+            errors[operation].update(counts)
+    return {"latencies": latencies, "errors": errors}, peaks, elapsed
+
+
+def summarize(load: dict, peaks: Dict[str, float], elapsed: float, ops_delta: Dict[str, int], config: dict) -> dict:
+    endpoints = {}
+    total_requests = total_errors = 0
+    for operation in sorted(load["latencies"]):
+        values = sorted(load["latencies"][operation])
+        failed = sum(load["errors"][operation].values())
+        total_requests += len(values)
+        total_errors += failed
+        endpoints[operation] = {
+            "count": len(values),
+            "error_rate": failed / len(values),
+            "errors": dict(load["errors"][operation]),
+            **{name: round(percentile(values, fraction), 3) for name, fraction in PERCENTILES.items()},
+        }
+    rss = list(peaks.values())
+    return {
+        "config": config,
+        "requests": total_requests,
+        "throughput_rps": round(total_requests / elapsed, 1) if elapsed else 0.0,
+        "error_rate": total_errors / total_requests if total_requests else 0.0,
+        "endpoints": endpoints,
+        "mongo_opcounters": ops_delta,
+        "mongo_ops_per_request": round(sum(ops_delta.values()) / total_requests, 3) if total_requests else 0.0,
+        "worker_rss_mb": {
+            "max": round(max(rss), 1) if rss else 0.0,
+            "mean": round(sum(rss) / len(rss), 1) if rss else 0.0,
+            "per_worker": {pid: round(peak, 1) for pid, peak in peaks.items()},
+        },
+    }
+
+
+def gated_metrics(summary: dict) -> Dict[str, float]:
+    """The metrics compared against the baseline; higher is worse for all of them."""
+    metrics = {
+        "error_rate": summary["error_rate"],
+        "mongo_ops_per_request": summary["mongo_ops_per_request"],
+        "worker_rss_mb.max": summary["worker_rss_mb"]["max"],
+    }
+    for operation, endpoint in summary["endpoints"].items():
+        metrics[f"{operation}.error_rate"] = endpoint["error_rate"]
+        for name in PERCENTILES:
+            metrics[f"{operation}.{name}"] = endpoint[name]
+    return metrics
+
+
+def allowance(metric: str) -> float:
+    for suffix, value in ALLOWANCES.items():
+        if suffix in metric:
+            return value
+    return 0.0
+
+
+def compare(summary: dict, baseline: dict, threshold: float) -> List[str]:
+    """Describe every gated metric that regressed past the baseline."""
+    current, previous = gated_metrics(summary), gated_metrics(baseline)
+    regressions = []
+    for metric in sorted(current.keys() & previous.keys()):
+        limit = previous[metric] * (1 + threshold) + allowance(metric)
+        if current[metric] > limit:
+            regressions.append(f"{metric}: {current[metric]:.4g} > {limit:.4g} (baseline {previous[metric]:.4g})")
+    return regressions
+
+
+def print_report(summary: dict):
+    print(f"\n{summary['requests']} requests, {summary['throughput_rps']} req/s, error rate {summary['error_rate']:.2%}")
+    print(f"{'endpoint':<16} {'count':>8} {'errors':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for operation, endpoint in summary["endpoints"].items():
+        print(
+            f"{operation:<16} {endpoint['count']:>8} {endpoint['error_rate']:>8.2%} "
+            f"{endpoint['p50_ms']:>9.1f} {endpoint['p95_ms']:>9.1f} {endpoint['p99_ms']:>9.1f}"
+        )
+    print(f"\nMongo ops per request: {summary['mongo_ops_per_request']} {summary['mongo_opcounters']}")
+    rss = summary["worker_rss_mb"]
+    print(f"Worker peak RSS: max {rss['max']} MB, mean {rss['mean']} MB over {len(rss['per_worker'])} workers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=120.0, help="seconds of load per client")
+    parser.add_argument("--managers", type=int, default=20)
+    parser.add_argument("--team-size", type=int, default=8)
+    parser.add_argument("--feedback-per-employee", type=int, default=10)
+    parser.add_argument("--database", default="feedback_soak")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--baseline", default=os.path.join(BACKEND_DIR, "soak_baseline.json"))
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--output", help="also write this run's results to a JSON file")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if args.database == os.getenv("DATABASE_NAME"):
+        parser.error("--database is dropped by the soak test and must not be DATABASE_NAME")
+
+    mongo = MongoClient(os.getenv("MONGODB_URL", "mongodb://localhost:27017"))
+    users, feedback_count = seed(
+        mongo[args.database], args.managers, args.team_size, args.feedback_per_employee, random.Random(args.seed)
+    )
+    print(f"Seeded {len(users)} users and {feedback_count} feedback into {args.database}")
+
+    config = {
+        "workers": args.workers,
+        "clients": args.clients,
+        "duration": args.duration,
+        "managers": args.managers,
+        "team_size": args.team_size,
+        "feedback_per_employee": args.feedback_per_employee,
+    }
+    server = launch(args.database, args.port, args.workers)
+    try:
+        wait_until_ready(server, args.port)
+        workers = worker_pids(server.pid, args.workers)
+        print(f"uvicorn ready with workers {workers}; running {args.clients} clients for {args.duration:.0f}s")
+        before = opcounters(mongo)
+        load, peaks, elapsed = run_load(args, users, workers)
+        after = opcounters(mongo)
+    finally:
+        stop(server)
+        mongo.drop_database(args.database)
+
+    summary = summarize(load, peaks, elapsed, {name: after[name] - before.get(name, 0) for name in after}, config)
+    print_report(summary)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(summary, output, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as output:
+            json.dump(summary, output, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; rerun with --update-baseline to record one")
+        return
+    with open(args.baseline) as source:
+        baseline = json.load(source)
+    if baseline.get("config") != config:
+        sys.exit(f"\nBaseline was recorded with {baseline.get('config')}, this run used {config}")
+    regressions = compare(summary, baseline, args.threshold)
+    if regressions:
+        print(f"\nRegressed beyond {args.threshold:.0%} of the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"\nWithin {args.threshold:.0%} of the baseline")
+
+
+if __name__ == "__main__":
+    main()
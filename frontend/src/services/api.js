@@ -7,6 +7,28 @@ const api = axios.create({
   },
 });
 
+// The backend returns the cluster time of each request in this header. Sending
+// the latest one back makes reads served by other workers or by replica set
+// secondaries include this user's own writes.
+const CAUSAL_TOKEN_HEADER = 'X-Causal-Token';
+const CAUSAL_TOKEN_KEY = 'causalToken';
+
+// Tokens look like "<seconds>.<increment>"; keep whichever is later.
+const isNewerCausalToken = (candidate, current) => {
+  if (!current) return true;
+  const [candidateSeconds, candidateIncrement] = candidate.split('.').map(Number);
+  const [currentSeconds, currentIncrement] = current.split('.').map(Number);
+  return candidateSeconds > currentSeconds
+    || (candidateSeconds === currentSeconds && candidateIncrement > currentIncrement);
+};
+
+const rememberCausalToken = (response) => {
+  const causalToken = response?.headers?.[CAUSAL_TOKEN_HEADER.toLowerCase()];
+  if (causalToken && isNewerCausalToken(causalToken, localStorage.getItem(CAUSAL_TOKEN_KEY))) {
+    localStorage.setItem(CAUSAL_TOKEN_KEY, causalToken);
+  }
+};
+
 // Request interceptor to add auth token
 api.interceptors.request.use(
   (config) => {
@@ -14,6 +36,10 @@ api.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    const causalToken = localStorage.getItem(CAUSAL_TOKEN_KEY);
+    if (causalToken) {
+      config.headers[CAUSAL_TOKEN_HEADER] = causalToken;
+    }
     return config;
   },
   (error) => {
@@ -23,8 +49,12 @@ api.interceptors.request.use(
 
 // Response interceptor to handle auth errors
 api.interceptors.response.use(
-  (response) => response,
+  (response) => {
+    rememberCausalToken(response);
+    return response;
+  },
   (error) => {
+    rememberCausalToken(error.response);
     if (error.response?.status === 401) {
       localStorage.removeItem('token');
       window.location.href = '/';